@@ -9,13 +9,236 @@ Proporciona un menú CLI para probar todas las funcionalidades.
 Uso: python client_console.py [host] [puerto]
 """
 
+import asyncio
+import atexit
+import io
+import json
+import re
+import selectors
 import socket
+import struct
 import sys
 import os
+import threading
+import time
+from functools import partial
+from typing import Optional
+
+# Telemetría en msgpack si el servidor la emite así (opcional)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Edición de línea e historial si el intérprete incluye readline (POSIX)
+try:
+    import readline
+except ImportError:
+    readline = None
 
 # Configuración por defecto
 DEFAULT_HOST = "localhost"
 DEFAULT_PORT = 5000
+UDP_PORT = 5001  # Telemetría broadcast del servidor
+RECV_SIZE = 65536  # Lectura optimista: una respuesta completa cabe de sobra
+CLEAR_SCREEN = "\x1b[2J\x1b[H"  # Borrar pantalla y cursor al inicio (ANSI)
+CACHE_TTL = 2.0  # segundos que se reutiliza la respuesta de LIST/LOG
+HISTORY_FILE = os.path.expanduser("~/.domotic_history")
+HISTORY_LENGTH = 500
+CONNECT_TIMEOUT = 10  # segundos para conectar y recibir la bienvenida
+# Keepalive: primer sondeo a los 30 s de inactividad, cada 10 s, 3 intentos
+_KEEPALIVE_OPTIONS = tuple(
+    (getattr(socket, name), value)
+    for name, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3))
+    if hasattr(socket, name)
+)
+# SO_LINGER activo con 0 s: cerrar con RST, sin dejar TIME_WAIT en el cliente
+_LINGER_ABORT = struct.pack("ii", 1, 0)
+# ACK inmediato (solo Linux); el kernel lo desactiva solo, hay que renovarlo
+_TCP_QUICKACK = getattr(socket, "TCP_QUICKACK", None)
+FRAME_HEADER = struct.Struct(">I")  # Prefijo de longitud de las respuestas FRAMED
+# Registro de LIST BIN (mismo formato que el servidor) y códigos de estado
+LIST_RECORD = struct.Struct(">32sBIB3sBhh")
+LIST_BIN_PREFIX = b"OK BIN "
+_ESTADOS = ("OFF", "ON", "N/A")
+# Telemetría UDP binaria (TELEMETRY_FORMAT=bin): cabecera + registros con tipo
+TELEMETRY_MAGIC = b"B"
+TELEMETRY_HEADER = struct.Struct(">cdB")
+TELEMETRY_RECORD = struct.Struct(">B32sBIB3sBhh")
+
+# Entrada interactiva (readline) o redirigida; se consulta una sola vez
+_STDIN_IS_TTY = sys.stdin is not None and sys.stdin.isatty()
+
+# Validadores de entrada compilados una sola vez
+_INT_RE = re.compile(r"-?[0-9]+")
+_FLOAT_RE = re.compile(r"-?[0-9]+(?:\.[0-9]+)?")
+_COLOR_RE = re.compile(r"#[0-9a-fA-F]{6}")
+
+# Comandos que no modifican el estado (los demás invalidan la caché)
+_READ_ONLY_COMMANDS = frozenset({"LIST", "LOG", "STATUS"})
+
+# Opciones del menú tras las que se espera a que el usuario pulse Enter
+_PAUSE_OPTIONS = frozenset("12345679")
+_ONOFF = frozenset({"ON", "OFF"})
+
+# Palabras que completa el tabulador (comandos, subcomandos e IDs)
+_COMPLETION_WORDS = (
+    "LOGIN",
+    "LIST",
+    "STATUS",
+    "SET",
+    "AUTO_OFF",
+    "LOG",
+    "EXIT",
+    "ON",
+    "OFF",
+    "BRIGHTNESS",
+    "COLOR",
+    "LEVEL",
+    "TEMP",
+    "luz_salon",
+    "enchufe_tv",
+    "enchufe_calefactor",
+    "cortinas",
+    "termostato",
+)
+
+# Tipo de dispositivo deducido de su ID: (fragmento del ID, emoji, tipo)
+_DEVICE_KIND_TABLE = (
+    ("luz", "💡", "luz"),
+    ("tv", "📺", "enchufe"),
+    ("calefactor", "🔥", "enchufe"),
+    ("cortinas", "🪟", "cortinas"),
+    ("termostato", "🌡️", "termostato"),
+)
+_DEFAULT_DEVICE_KIND = ("🔌", "enchufe")
+# Emoji del estado: solo ON se resalta (OFF y N/A usan el mismo)
+_STATE_EMOJI = {"ON": "🟢"}
+_STATE_EMOJI_DEFAULT = "⚫"
+
+# Textos estáticos de los menús (se construyen una sola vez)
+_MENU_TEMPLATE = (
+    "\n" + "=" * 60 + "\n"
+    "               SISTEMA DOMÓTICO - CLIENTE\n" + "=" * 60 + "\n"
+    "Servidor: {host}:{port}\n"
+    "Estado: {status}\n"
+    "Autenticación: {auth}\n"
+    "Telemetría: {telemetry}\n" + "=" * 60 + "\n"
+    "\n📋 MENÚ DE OPCIONES:\n"
+    "\n"
+    "  1. 🔐 Login (Autenticación)\n"
+    "  2. 📋 Listar todos los dispositivos\n"
+    "  3. 📊 Ver estado de un dispositivo\n"
+    "  4. 💡 Encender/Apagar dispositivo (requiere login)\n"
+    "  5. ⏰ Configurar auto-apagado (requiere login)\n"
+    "  6. 📜 Ver historial de eventos\n"
+    "  7. ⌨️  Enviar comando personalizado\n"
+    "  8. 🔄 Reconectar al servidor\n"
+    "  9. 📂 Ejecutar comandos desde archivo\n"
+    "  0. ❌ Salir\n"
+    "\n"
+)
+
+_SET_DEVICE_MENU = (
+    "\n⚙️  MODO GUIADO - CONTROL DE DISPOSITIVOS Y PARÁMETROS\n" + "=" * 80 + "\n"
+    "\n¿Qué deseas controlar?\n\n"
+    "  1. 💡 Luz del salón (ON/OFF)\n"
+    "  2. 🔆 Brillo de la luz (0-100%)\n"
+    "  3. 🎨 Color de la luz (#RRGGBB)\n"
+    "  4. 📺 TV (ON/OFF)\n"
+    "  5. 🔥 Calefactor (ON/OFF)\n"
+    "  6. 🪟 Cortinas - Posición (0-100%)\n"
+    "  7. 🌡️  Termostato - Temperatura objetivo (16-30°C)\n"
+    "  0. ↩️  Cancelar\n"
+    "\n"
+)
+_COLOR_MENU = (
+    "\n🎨 CAMBIAR COLOR DE LA LUZ\n" + "-" * 60 + "\n"
+    "Colores predefinidos:\n"
+    "  1. Blanco (#ffffff)\n"
+    "  2. Cálido (#ffd699)\n"
+    "  3. Azul (#0066ff)\n"
+    "  4. Rojo (#ff0000)\n"
+    "  5. Verde (#00ff00)\n"
+    "  6. Personalizado\n"
+)
+_AUTH_REQUIRED = (
+    "\n❌ Esta función requiere autenticación.\n"
+    "   Por favor, use la opción 1 (Login) primero.\n\n"
+)
+
+
+class TelemetryMonitor(asyncio.DatagramProtocol):
+    """
+    Recibe la telemetría UDP en segundo plano mientras el menú TCP espera
+    al usuario. Usa un bucle asyncio propio en un hilo daemon y guarda la
+    última instantánea recibida para resumirla en el menú.
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+        self.latest = None  # (instante, payload) del último paquete válido
+        self._loop = None
+
+    def start(self) -> bool:
+        """Abre el socket UDP y arranca el bucle; False si no es posible"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # Compartir el puerto con udp_listener.py u otros clientes
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("", self.port))
+        except OSError:
+            return False
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._run, args=(sock,), daemon=True).start()
+        return True
+
+    def _run(self, sock: socket.socket):
+        """Cuerpo del hilo: registra el endpoint y atiende datagramas"""
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        transport, _ = loop.run_until_complete(
+            loop.create_datagram_endpoint(lambda: self, sock=sock)
+        )
+        try:
+            loop.run_forever()
+        finally:
+            transport.close()
+            loop.close()
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            if data[:1] == TELEMETRY_MAGIC:
+                # Para el resumen basta con el estado de cada registro
+                records = TELEMETRY_RECORD.iter_unpack(
+                    memoryview(data)[TELEMETRY_HEADER.size :]
+                )
+                payload = {"devices": [{"estado": _ESTADOS[r[2]]} for r in records]}
+            elif data[:1] == b"{" or msgpack is None:
+                payload = json.loads(data)
+            else:
+                payload = msgpack.unpackb(data, raw=False)
+        except (ValueError, struct.error):
+            return
+        self.latest = (time.monotonic(), payload)
+
+    def stop(self):
+        """Detiene el bucle (seguro desde cualquier hilo)"""
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def summary(self) -> str:
+        """Resumen de una línea para la cabecera del menú"""
+        if self._loop is None:
+            return "🔴 No disponible"
+        if self.latest is None:
+            return "⏳ Sin datos todavía"
+        received, payload = self.latest
+        devices = payload.get("devices", [])
+        on = sum(1 for d in devices if d.get("estado") == "ON")
+        age = time.monotonic() - received
+        return f"📡 hace {age:.0f}s | {on}/{len(devices)} encendidos"
 
 
 class DomoticClient:
@@ -25,24 +248,111 @@ class DomoticClient:
         self.host = host
         self.port = port
         self.socket = None
+        self._rxbuf = bytearray()  # Bytes recibidos pendientes de procesar
+        self._rxview = memoryview(bytearray(RECV_SIZE))  # Buffer fijo para recv_into
+        self._selector = None  # Vigila el socket mientras el usuario está en el menú
+        self._cache = {}  # comando -> (instante, respuesta) de LIST/LOG recientes
+        self._framed = False  # Respuestas con prefijo de longitud (comando FRAMED)
         self.connected = False
         self.authenticated = False
         self.username = None
+        self.telemetry = TelemetryMonitor(UDP_PORT)
+        # Opción del menú principal -> acción
+        self._actions = {
+            "1": self.login,
+            "2": self.list_devices,
+            "3": self.get_status,
+            "4": self.set_device,
+            "5": self.set_auto_off,
+            "6": self.view_log,
+            "7": self.send_custom_command,
+            "8": self.reconnect,
+            "9": self.run_batch_file,
+        }
+        # Opción del menú de control -> manejador ya parametrizado
+        self._set_handlers = {
+            "1": partial(
+                self._set_onoff,
+                "luz_salon",
+                "\n💡 CONTROL DE LUZ DEL SALÓN",
+                "Luz del salón",
+                "❌ Estado inválido (debe ser ON u OFF)",
+            ),
+            "2": partial(
+                self._set_percent,
+                "luz_salon BRIGHTNESS",
+                "\n🔆 AJUSTAR BRILLO DE LA LUZ",
+                "Nivel de brillo actual: (ver con opción 2 del menú)",
+                "Nuevo brillo (0-100): ",
+                "Brillo ajustado",
+                "❌ El brillo debe estar entre 0 y 100",
+            ),
+            "3": self._set_color,
+            "4": partial(
+                self._set_onoff,
+                "enchufe_tv",
+                "\n📺 CONTROL DE TV",
+                "TV",
+                "❌ Estado inválido",
+            ),
+            "5": partial(
+                self._set_onoff,
+                "enchufe_calefactor",
+                "\n🔥 CONTROL DE CALEFACTOR",
+                "Calefactor",
+                "❌ Estado inválido",
+            ),
+            "6": partial(
+                self._set_percent,
+                "cortinas LEVEL",
+                "\n🪟 AJUSTAR CORTINAS",
+                "  0% = Completamente cerradas\n100% = Completamente abiertas",
+                "\nPosición (0-100): ",
+                "Cortinas ajustadas",
+                "❌ La posición debe estar entre 0 y 100",
+            ),
+            "7": self._set_temperature,
+        }
 
     def connect(self) -> bool:
         """Establece conexión con el servidor"""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(10)  # Timeout de 10 segundos
+            self.socket.settimeout(CONNECT_TIMEOUT)  # Solo conexión y bienvenida
+            # Comandos cortos de petición/respuesta: enviar sin esperar a Nagle
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # Detectar a nivel de TCP si el servidor desaparece sin cerrar
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for option, value in _KEEPALIVE_OPTIONS:
+                self.socket.setsockopt(socket.IPPROTO_TCP, option, value)
             self.socket.connect((self.host, self.port))
+            self._rxbuf.clear()
+            self._cache.clear()
+            self._framed = False
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self.socket, selectors.EVENT_READ)
             self.connected = True
 
-            # Leer mensaje de bienvenida
-            welcome = self.socket.recv(4096).decode("utf-8")
+            # Leer mensaje de bienvenida (termina con una línea vacía)
+            welcome_lines = []
+            while True:
+                line = self._read_line()
+                if not line:
+                    break
+                welcome_lines.append(line)
+            welcome = "\n".join(welcome_lines)
             print("\n" + "=" * 60)
             print(welcome)
             print("=" * 60 + "\n")
 
+            # Pedir respuestas con prefijo de longitud; un servidor antiguo
+            # contesta con ERROR y se sigue en modo texto
+            self.socket.sendall(b"FRAMED\n")
+            self._framed = self._read_line() == "OK FRAMED"
+
+            # Ya conectado: sin timeout global, cada comando puede pedir el suyo
+            self.socket.settimeout(None)
+
             return True
 
         except ConnectionRefusedError:
@@ -58,29 +368,193 @@ class DomoticClient:
             print(f"❌ Error de conexión: {e}")
             return False
 
-    def send_command(self, command: str) -> str:
+    def _recv_chunk(self) -> int:
+        """
+        Recibe lo disponible en el socket sobre el buffer preasignado y lo
+        añade a los datos pendientes. Retorna los bytes leídos (0 = cerrado).
+        """
+        n = self.socket.recv_into(self._rxview)
+        self._rxbuf += self._rxview[:n]
+        if n and _TCP_QUICKACK is not None:
+            self.socket.setsockopt(socket.IPPROTO_TCP, _TCP_QUICKACK, 1)
+        return n
+
+    def _read_line(self) -> str:
+        """
+        Lee una línea completa de la respuesta del servidor.
+        Cada recv() pide todo lo disponible y lo sobrante queda en el buffer
+        para la siguiente línea, así normalmente basta una llamada por comando.
+        """
+        while True:
+            idx = self._rxbuf.find(b"\n")
+            if idx >= 0:
+                line = bytes(self._rxbuf[:idx])
+                del self._rxbuf[: idx + 1]
+                return line.decode("utf-8").strip()
+
+            if not self._recv_chunk():
+                raise ConnectionError("el servidor cerró la conexión")
+
+    def _recv_exact(self, size: int) -> bytes:
+        """Lee exactamente size bytes (lo ya recibido se consume primero)"""
+        while len(self._rxbuf) < size:
+            if not self._recv_chunk():
+                raise ConnectionError("el servidor cerró la conexión")
+        data = bytes(self._rxbuf[:size])
+        del self._rxbuf[:size]
+        return data
+
+    def _read_frame(self) -> bytes:
+        """Lee una respuesta en modo FRAMED: 4 bytes de longitud + cuerpo"""
+        (size,) = FRAME_HEADER.unpack(self._recv_exact(FRAME_HEADER.size))
+        return self._recv_exact(size)
+
+    def cached_command(self, command: str, raw: bool = False):
+        """
+        Igual que send_command pero reutiliza una respuesta correcta obtenida
+        hace menos de CACHE_TTL segundos (solo para comandos de lectura).
+        """
+        now = time.monotonic()
+        entry = self._cache.get(command)
+        if entry and now - entry[0] < CACHE_TTL:
+            return entry[1]
+
+        response = self.send_command(command, raw=raw)
+        if response.startswith(b"OK" if isinstance(response, bytes) else "OK"):
+            self._cache[command] = (now, response)
+        return response
+
+    def _close_selector(self):
+        """Libera el selector asociado al socket actual"""
+        if self._selector:
+            self._selector.close()
+            self._selector = None
+
+    def poll_server(self):
+        """
+        Atiende sin bloquear lo que haya llegado mientras el usuario estaba
+        en el menú: detecta si el servidor cerró la conexión y muestra los
+        mensajes no solicitados para que no se confundan con la próxima
+        respuesta.
+        """
+        if not self.connected or not self._selector:
+            return
+
+        try:
+            while self._selector.select(timeout=0):
+                if not self._recv_chunk():
+                    print("\n⚠️  El servidor cerró la conexión")
+                    self.connected = False
+                    self.authenticated = False
+                    return
+        except OSError as e:
+            print(f"\n⚠️  Conexión perdida: {e}")
+            self.connected = False
+            self.authenticated = False
+            return
+
+        if self._framed:
+            header = FRAME_HEADER.size
+            while len(self._rxbuf) >= header and len(self._rxbuf) >= (
+                header + FRAME_HEADER.unpack_from(self._rxbuf)[0]
+            ):
+                msg = self._read_frame().decode("utf-8", "replace")
+                print(f"📨 Servidor: {msg}")
+            return
+
+        while b"\n" in self._rxbuf:
+            line = self._read_line()
+            if line:
+                print(f"📨 Servidor: {line}")
+
+    def send_command(
+        self, command: str, timeout: Optional[float] = None, raw: bool = False
+    ):
         """
         Envía un comando al servidor y retorna la respuesta.
-        Maneja la comunicación de bajo nivel.
+        Maneja la comunicación de bajo nivel. Con timeout (segundos) se
+        limita la espera solo para este comando; por defecto no hay límite.
+        Con raw=True en modo FRAMED se retorna el cuerpo sin decodificar
+        (bytes); los errores locales siempre se retornan como texto.
         """
         if not self.connected:
             return "ERROR: No conectado al servidor"
 
+        # Cualquier comando que pueda cambiar el estado invalida la caché
+        verb = command.split(maxsplit=1)[0].upper() if command.strip() else ""
+        if verb not in _READ_ONLY_COMMANDS:
+            self._cache.clear()
+
         try:
+            if timeout is not None:
+                self.socket.settimeout(timeout)
+
             # Enviar comando (agregar \n si no lo tiene)
             if not command.endswith("\n"):
                 command += "\n"
-            self.socket.send(command.encode("utf-8"))
+            self.socket.sendall(command.encode("utf-8"))
 
-            # Recibir respuesta
-            response = self.socket.recv(4096).decode("utf-8").strip()
-            return response
+            return self._read_reply(raw)
 
         except socket.timeout:
             return "ERROR: Timeout esperando respuesta del servidor"
+        except UnicodeDecodeError:
+            # La respuesta ya se consumió entera: la conexión sigue siendo válida
+            return "ERROR: Respuesta del servidor no es texto UTF-8"
         except Exception as e:
             self.connected = False
             return f"ERROR: Conexión perdida - {e}"
+        finally:
+            if timeout is not None and self.connected:
+                self.socket.settimeout(None)
+
+    def _read_reply(self, raw: bool = False):
+        """Lee una respuesta completa del servidor según el modo de la conexión"""
+        # Modo FRAMED: la longitud delimita la respuesta completa
+        if self._framed:
+            body = self._read_frame()
+            if raw:
+                return body
+            if body.startswith(LIST_BIN_PREFIX):
+                # LIST BIN escrito a mano: sus registros no son texto
+                count = (len(body) - len(LIST_BIN_PREFIX)) // LIST_RECORD.size
+                return f"OK BIN {count} registros ({len(body)} bytes)"
+            return body.decode("utf-8", "replace")
+
+        # Modo texto: una línea, salvo LOG ("OK LOG <n>" + n líneas)
+        response = self._read_line()
+        parts = response.split()
+        if parts[:2] == ["OK", "LOG"]:
+            count = int(parts[2]) if len(parts) > 2 else 0
+            lines = [self._read_line() for _ in range(count)]
+            response = "\n".join([response, *lines])
+        return response
+
+    def send_commands(self, commands: list) -> list:
+        """
+        Envía varios comandos en un único sendall y lee después todas las
+        respuestas en orden (el servidor las atiende por líneas), así una
+        ráfaga de N comandos cuesta un solo viaje de ida y vuelta.
+        """
+        if not self.connected:
+            return ["ERROR: No conectado al servidor"] * len(commands)
+
+        self._cache.clear()
+        responses = []
+        try:
+            self.socket.sendall(
+                b"".join(cmd.rstrip("\n").encode("utf-8") + b"\n" for cmd in commands)
+            )
+            for _ in commands:
+                responses.append(self._read_reply())
+        except socket.timeout:
+            responses.append("ERROR: Timeout esperando respuesta del servidor")
+        except Exception as e:
+            self.connected = False
+            responses.append(f"ERROR: Conexión perdida - {e}")
+        # Comandos sin respuesta por un error anterior
+        responses.extend(["ERROR: Sin respuesta"] * (len(commands) - len(responses)))
+        return responses
 
     def login(self):
         """Maneja el proceso de autenticación"""
@@ -91,8 +565,9 @@ class DomoticClient:
         print("  - user / pass123")
         print("-" * 60)
 
-        username = input("Usuario: ").strip()
-        password = input("Contraseña: ").strip()
+        username = _prompt("Usuario: ").strip()
+        password = _prompt("Contraseña: ").strip()
+        _forget_last_input()  # La contraseña no debe acabar en el historial
 
         if not username or not password:
             print("❌ Usuario y contraseña no pueden estar vacíos")
@@ -108,93 +583,138 @@ class DomoticClient:
         else:
             print("❌ Autenticación fallida")
 
+    def _fetch_device_rows(self):
+        """
+        Obtiene el listado de dispositivos como (total, filas), donde cada
+        fila son los 8 campos del protocolo en texto, o (None, error).
+        En modo FRAMED pide LIST BIN y desempaqueta los registros de una vez
+        con struct.iter_unpack en lugar de trocear cadenas.
+        """
+        if self._framed:
+            response = self.cached_command("LIST BIN", raw=True)
+            if isinstance(response, bytes) and response.startswith(LIST_BIN_PREFIX):
+                estados = _ESTADOS
+                rows = [
+                    (
+                        dev_id.rstrip(b"\0").decode("utf-8"),
+                        estados[estado],
+                        str(auto_off),
+                        str(brightness),
+                        "#" + color.hex(),
+                        str(curtains),
+                        f"{temp / 10:g}",
+                        f"{target_temp / 10:g}",
+                    )
+                    for (
+                        dev_id,
+                        estado,
+                        auto_off,
+                        brightness,
+                        color,
+                        curtains,
+                        temp,
+                        target_temp,
+                    ) in LIST_RECORD.iter_unpack(
+                        memoryview(response)[len(LIST_BIN_PREFIX) :]
+                    )
+                ]
+                return str(len(rows)), rows
+            if isinstance(response, bytes):
+                response = response.decode("utf-8", "replace")
+            return None, f"❌ Error: {response}"
+
+        response = self.cached_command("LIST")
+        ok, tail = _parse_reply(response)
+        if not ok:
+            return None, f"❌ Error: {response}"
+        count, _, devices_str = tail.partition(" ")
+        if not devices_str:
+            return None, "Formato de respuesta inesperado"
+        rows = [
+            device_info
+            for device_info in (d.split(",", 7) for d in devices_str.split(";"))
+            if len(device_info) == 8
+        ]
+        return count, rows
+
     def list_devices(self):
         """Lista todos los dispositivos con todos sus parámetros"""
-        print("\n📋 LISTADO COMPLETO DE DISPOSITIVOS")
-        print("=" * 100)
+        buf = io.StringIO()
+        buf.write("\n📋 LISTADO COMPLETO DE DISPOSITIVOS\n")
+        buf.write("=" * 100 + "\n")
+
+        count, rows = self._fetch_device_rows()
+
+        if count is not None:
+            buf.write(f"Total de dispositivos: {count}\n\n")
+
+            # Referencias locales: evitan búsquedas de atributo/global por iteración
+            write = buf.write
+            table = _DEVICE_KIND_TABLE
+            default_kind = _DEFAULT_DEVICE_KIND
+            state_emoji = _STATE_EMOJI.get
+
+            for (
+                dev_id,
+                estado,
+                auto_off,
+                brightness,
+                color,
+                curtains,
+                temp,
+                target_temp,
+            ) in rows:
+                # Emoji y tipo según el ID (una sola pasada por la tabla)
+                emoji, kind = next(
+                    (
+                        (emoji, kind)
+                        for fragment, emoji, kind in table
+                        if fragment in dev_id
+                    ),
+                    default_kind,
+                )
 
-        response = self.send_command("LIST")
+                estado_emoji = state_emoji(estado, _STATE_EMOJI_DEFAULT)
+                auto_info = f"{auto_off}s" if auto_off != "0" else "--"
 
-        if response.startswith("OK"):
-            parts = response.split(maxsplit=2)
-            if len(parts) >= 3:
-                count = parts[1]
-                devices_str = parts[2]
-
-                print(f"Total de dispositivos: {count}\n")
-
-                for device_data in devices_str.split(";"):
-                    device_info = device_data.split(",")
-                    if len(device_info) >= 8:
-                        (
-                            dev_id,
-                            estado,
-                            auto_off,
-                            brightness,
-                            color,
-                            curtains,
-                            temp,
-                            target_temp,
-                        ) = device_info[:8]
-
-                        # Emoji según el tipo y estado
-                        if "luz" in dev_id:
-                            emoji = "💡"
-                        elif "tv" in dev_id:
-                            emoji = "📺"
-                        elif "calefactor" in dev_id:
-                            emoji = "🔥"
-                        elif "cortinas" in dev_id:
-                            emoji = "🪟"
-                        elif "termostato" in dev_id:
-                            emoji = "🌡️"
-                        else:
-                            emoji = "🔌"
-
-                        estado_emoji = "🟢" if estado == "ON" else "⚫"
-                        auto_info = f"{auto_off}s" if auto_off != "0" else "--"
-
-                        print(f"{emoji} {estado_emoji} {dev_id:<20}")
-                        if "cortinas" not in dev_id and "termostato" not in dev_id:
-                            print(
-                                f"   └─ Estado: {estado:<5} | Auto-Off: {auto_info:<8}"
-                            )
-
-                        if "luz" in dev_id:
-                            print(f"   └─ Brillo: {brightness}% | Color: {color}")
-                        elif "cortinas" in dev_id:
-                            print(f"   └─ Posición: {curtains}% abierto")
-                        elif "termostato" in dev_id:
-                            print(
-                                f"   └─ Temperatura: {temp}°C → Objetivo: {target_temp}°C"
-                            )
-
-                        print()
-            else:
-                print("Formato de respuesta inesperado")
+                write(f"{emoji} {estado_emoji} {dev_id:<20}\n")
+                if kind != "cortinas" and kind != "termostato":
+                    write(f"   └─ Estado: {estado:<5} | Auto-Off: {auto_info:<8}\n")
+
+                if kind == "luz":
+                    write(f"   └─ Brillo: {brightness}% | Color: {color}\n")
+                elif kind == "cortinas":
+                    write(f"   └─ Posición: {curtains}% abierto\n")
+                elif kind == "termostato":
+                    write(f"   └─ Temperatura: {temp}°C → Objetivo: {target_temp}°C\n")
+
+                write("\n")
         else:
-            print(f"❌ Error: {response}")
-        print("=" * 100)
+            buf.write(rows + "\n")
+        buf.write("=" * 100 + "\n")
+        sys.stdout.write(buf.getvalue())
 
     def get_status(self):
         """Obtiene el estado de un dispositivo específico"""
         print("\n📊 ESTADO DE DISPOSITIVO")
         print("-" * 60)
 
-        device_id = input("ID del dispositivo: ").strip()
+        device_id = _prompt("ID del dispositivo: ").strip()
         if not device_id:
             print("❌ ID no puede estar vacío")
             return
 
         response = self.send_command(f"STATUS {device_id}")
 
-        if response.startswith("OK"):
-            parts = response.split()
-            if len(parts) >= 4:
-                dev_id, estado, auto_off = parts[1], parts[2], parts[3]
+        ok, tail = _parse_reply(response)
+        if ok:
+            parts = tail.split()
+            if len(parts) >= 3:
+                dev_id, estado, auto_off = parts[0], parts[1], parts[2]
+                estado_emoji = _STATE_EMOJI.get(estado, _STATE_EMOJI_DEFAULT)
 
                 print(f"\n🔍 Dispositivo: {dev_id}")
-                print(f"   Estado: {estado} {'🟢' if estado == 'ON' else '⚫'}")
+                print(f"   Estado: {estado} {estado_emoji}")
                 print(
                     f"   Auto-Off: {auto_off}s {'(Activo)' if auto_off != '0' else '(Desactivado)'}"
                 )
@@ -206,205 +726,141 @@ class DomoticClient:
     def set_device(self):
         """Modo guiado completo para cambiar parámetros de dispositivos (requiere autenticación)"""
         if not self.authenticated:
-            print("\n❌ Esta función requiere autenticación.")
-            print("   Por favor, use la opción 1 (Login) primero.\n")
+            sys.stdout.write(_AUTH_REQUIRED)
             return
 
-        print("\n⚙️  MODO GUIADO - CONTROL DE DISPOSITIVOS Y PARÁMETROS")
-        print("=" * 80)
-        print("\n¿Qué deseas controlar?\n")
-        print("  1. 💡 Luz del salón (ON/OFF)")
-        print("  2. 🔆 Brillo de la luz (0-100%)")
-        print("  3. 🎨 Color de la luz (#RRGGBB)")
-        print("  4. 📺 TV (ON/OFF)")
-        print("  5. 🔥 Calefactor (ON/OFF)")
-        print("  6. 🪟 Cortinas - Posición (0-100%)")
-        print("  7. 🌡️  Termostato - Temperatura objetivo (16-30°C)")
-        print("  0. ↩️  Cancelar")
-        print()
+        sys.stdout.write(_SET_DEVICE_MENU)
+        sys.stdout.flush()
 
-        opcion = input("Selecciona una opción: ").strip()
+        opcion = _prompt("Selecciona una opción: ").strip()
 
-        if opcion == "1":
-            # Luz ON/OFF
-            print("\n💡 CONTROL DE LUZ DEL SALÓN")
-            print("-" * 60)
-            estado = input("Estado (ON/OFF): ").strip().upper()
-            if estado in ["ON", "OFF"]:
-                response = self.send_command(f"SET luz_salon {estado}")
-                if response.startswith("OK"):
-                    emoji = "🟢" if estado == "ON" else "⚫"
-                    print(f"\n✅ {emoji} Luz del salón: {estado}")
-                else:
-                    print(f"\n❌ {response}")
-            else:
-                print("❌ Estado inválido (debe ser ON u OFF)")
-
-        elif opcion == "2":
-            # Brillo
-            print("\n🔆 AJUSTAR BRILLO DE LA LUZ")
-            print("-" * 60)
-            print("Nivel de brillo actual: (ver con opción 2 del menú)")
-            brillo = input("Nuevo brillo (0-100): ").strip()
-            try:
-                brillo_val = int(brillo)
-                if 0 <= brillo_val <= 100:
-                    response = self.send_command(
-                        f"SET luz_salon BRIGHTNESS {brillo_val}"
-                    )
-                    if response.startswith("OK"):
-                        bar = "█" * (brillo_val // 5) + "░" * (20 - brillo_val // 5)
-                        print(f"\n✅ Brillo ajustado: {brillo_val}%")
-                        print(f"   [{bar}]")
-                    else:
-                        print(f"\n❌ {response}")
-                else:
-                    print("❌ El brillo debe estar entre 0 y 100")
-            except ValueError:
-                print("❌ Valor inválido")
-
-        elif opcion == "3":
-            # Color
-            print("\n🎨 CAMBIAR COLOR DE LA LUZ")
-            print("-" * 60)
-            print("Colores predefinidos:")
-            print("  1. Blanco (#ffffff)")
-            print("  2. Cálido (#ffd699)")
-            print("  3. Azul (#0066ff)")
-            print("  4. Rojo (#ff0000)")
-            print("  5. Verde (#00ff00)")
-            print("  6. Personalizado")
-
-            color_opcion = input("\nSelecciona: ").strip()
-            colores = {
-                "1": "#ffffff",
-                "2": "#ffd699",
-                "3": "#0066ff",
-                "4": "#ff0000",
-                "5": "#00ff00",
-            }
-
-            if color_opcion in colores:
-                color = colores[color_opcion]
-            elif color_opcion == "6":
-                color = input("Ingresa color en formato #RRGGBB: ").strip()
-            else:
-                print("❌ Opción inválida")
-                return
+        handler = self._set_handlers.get(opcion)
+        if handler is not None:
+            handler()
+        elif opcion == "0":
+            print("\n↩️  Cancelado")
+            return
+        else:
+            print("\n❌ Opción no válida")
 
-            if color.startswith("#") and len(color) == 7:
-                response = self.send_command(f"SET luz_salon COLOR {color}")
-                if response.startswith("OK"):
-                    print(f"\n✅ Color cambiado a: {color}")
-                else:
-                    print(f"\n❌ {response}")
+        print()
+
+    def _set_onoff(self, device_id: str, header: str, label: str, invalid_msg: str):
+        """Pide ON/OFF y lo aplica a un dispositivo"""
+        # Cabecera en una sola escritura; _prompt() vacía stdout antes del prompt
+        sys.stdout.write(f"{header}\n{'-' * 60}\n")
+        estado = _prompt("Estado (ON/OFF): ").strip().upper()
+        if estado in _ONOFF:
+            response = self.send_command(f"SET {device_id} {estado}")
+            if response.startswith("OK"):
+                emoji = _STATE_EMOJI.get(estado, _STATE_EMOJI_DEFAULT)
+                print(f"\n✅ {emoji} {label}: {estado}")
             else:
-                print("❌ Formato de color inválido (debe ser #RRGGBB)")
-
-        elif opcion == "4":
-            # TV
-            print("\n📺 CONTROL DE TV")
-            print("-" * 60)
-            estado = input("Estado (ON/OFF): ").strip().upper()
-            if estado in ["ON", "OFF"]:
-                response = self.send_command(f"SET enchufe_tv {estado}")
+                print(f"\n❌ {response}")
+        else:
+            print(invalid_msg)
+
+    def _set_percent(
+        self,
+        command: str,
+        header: str,
+        info: str,
+        prompt: str,
+        label: str,
+        range_msg: str,
+    ):
+        """Pide un porcentaje 0-100, lo envía como 'SET <command> <valor>' y dibuja la barra"""
+        sys.stdout.write(f"{header}\n{'-' * 60}\n{info}\n")
+        valor = _prompt(prompt).strip()
+        if _INT_RE.fullmatch(valor):
+            valor_int = int(valor)
+            if 0 <= valor_int <= 100:
+                response = self.send_command(f"SET {command} {valor_int}")
                 if response.startswith("OK"):
-                    emoji = "🟢" if estado == "ON" else "⚫"
-                    print(f"\n✅ {emoji} TV: {estado}")
+                    bar = "█" * (valor_int // 5) + "░" * (20 - valor_int // 5)
+                    print(f"\n✅ {label}: {valor_int}%")
+                    print(f"   [{bar}]")
                 else:
                     print(f"\n❌ {response}")
             else:
-                print("❌ Estado inválido")
-
-        elif opcion == "5":
-            # Calefactor
-            print("\n🔥 CONTROL DE CALEFACTOR")
-            print("-" * 60)
-            estado = input("Estado (ON/OFF): ").strip().upper()
-            if estado in ["ON", "OFF"]:
-                response = self.send_command(f"SET enchufe_calefactor {estado}")
+                print(range_msg)
+        else:
+            print("❌ Valor inválido")
+
+    def _set_color(self):
+        """Color de la luz del salón (predefinido o #RRGGBB)"""
+        sys.stdout.write(_COLOR_MENU)
+
+        color_opcion = _prompt("\nSelecciona: ").strip()
+        colores = {
+            "1": "#ffffff",
+            "2": "#ffd699",
+            "3": "#0066ff",
+            "4": "#ff0000",
+            "5": "#00ff00",
+        }
+
+        if color_opcion in colores:
+            color = colores[color_opcion]
+        elif color_opcion == "6":
+            color = _prompt("Ingresa color en formato #RRGGBB: ").strip()
+        else:
+            print("❌ Opción inválida")
+            return
+
+        if _COLOR_RE.fullmatch(color):
+            response = self.send_command(f"SET luz_salon COLOR {color}")
+            if response.startswith("OK"):
+                print(f"\n✅ Color cambiado a: {color}")
+            else:
+                print(f"\n❌ {response}")
+        else:
+            print("❌ Formato de color inválido (debe ser #RRGGBB)")
+
+    def _set_temperature(self):
+        """Temperatura objetivo del termostato (16-30°C)"""
+        sys.stdout.write(
+            "\n🌡️  AJUSTAR TEMPERATURA OBJETIVO DEL TERMOSTATO\n"
+            + "-" * 60
+            + "\nRango permitido: 16°C - 30°C\n"
+        )
+        temp = _prompt("\nTemperatura deseada: ").strip()
+        if _FLOAT_RE.fullmatch(temp):
+            temp_val = float(temp)
+            if 16 <= temp_val <= 30:
+                response = self.send_command(f"SET termostato TEMP {temp_val}")
                 if response.startswith("OK"):
-                    emoji = "🟢" if estado == "ON" else "⚫"
-                    print(f"\n✅ {emoji} Calefactor: {estado}")
+                    print(f"\n✅ Temperatura objetivo del termostato: {temp_val}°C")
                 else:
                     print(f"\n❌ {response}")
             else:
-                print("❌ Estado inválido")
-
-        elif opcion == "6":
-            # Cortinas
-            print("\n🪟 AJUSTAR CORTINAS")
-            print("-" * 60)
-            print("  0% = Completamente cerradas")
-            print("100% = Completamente abiertas")
-            posicion = input("\nPosición (0-100): ").strip()
-            try:
-                pos_val = int(posicion)
-                if 0 <= pos_val <= 100:
-                    response = self.send_command(f"SET cortinas LEVEL {pos_val}")
-                    if response.startswith("OK"):
-                        bar = "█" * (pos_val // 5) + "░" * (20 - pos_val // 5)
-                        print(f"\n✅ Cortinas ajustadas: {pos_val}%")
-                        print(f"   [{bar}]")
-                    else:
-                        print(f"\n❌ {response}")
-                else:
-                    print("❌ La posición debe estar entre 0 y 100")
-            except ValueError:
-                print("❌ Valor inválido")
-
-        elif opcion == "7":
-            # Temperatura
-            print("\n🌡️  AJUSTAR TEMPERATURA OBJETIVO DEL TERMOSTATO")
-            print("-" * 60)
-            print("Rango permitido: 16°C - 30°C")
-            temp = input("\nTemperatura deseada: ").strip()
-            try:
-                temp_val = float(temp)
-                if 16 <= temp_val <= 30:
-                    response = self.send_command(f"SET termostato TEMP {temp_val}")
-                    if response.startswith("OK"):
-                        print(f"\n✅ Temperatura objetivo del termostato: {temp_val}°C")
-                    else:
-                        print(f"\n❌ {response}")
-                else:
-                    print("❌ La temperatura debe estar entre 16 y 30°C")
-            except ValueError:
-                print("❌ Valor inválido")
-
-        elif opcion == "0":
-            print("\n↩️  Cancelado")
-            return
+                print("❌ La temperatura debe estar entre 16 y 30°C")
         else:
-            print("\n❌ Opción no válida")
-
-        print()
+            print("❌ Valor inválido")
 
     def set_auto_off(self):
         """Configura el autoapagado (requiere autenticación)"""
         if not self.authenticated:
-            print("\n❌ Esta función requiere autenticación.")
-            print("   Por favor, use la opción 1 (Login) primero.\n")
+            sys.stdout.write(_AUTH_REQUIRED)
             return
 
         print("\n⏰ CONFIGURAR AUTO-APAGADO")
         print("-" * 60)
 
-        device_id = input("ID del dispositivo: ").strip()
-        segundos_str = input("Segundos para apagar (0 = desactivar): ").strip()
+        device_id = _prompt("ID del dispositivo: ").strip()
+        segundos_str = _prompt("Segundos para apagar (0 = desactivar): ").strip()
 
         if not device_id or not segundos_str:
             print("❌ Entrada inválida")
             return
 
-        try:
-            segundos = int(segundos_str)
-            if segundos < 0:
-                print("❌ Los segundos deben ser >= 0")
-                return
-        except ValueError:
+        if not _INT_RE.fullmatch(segundos_str):
             print("❌ Segundos debe ser un número entero")
             return
+        segundos = int(segundos_str)
+        if segundos < 0:
+            print("❌ Los segundos deben ser >= 0")
+            return
 
         response = self.send_command(f"AUTO_OFF {device_id} {segundos}")
 
@@ -422,30 +878,32 @@ class DomoticClient:
 
     def view_log(self):
         """Muestra el historial de eventos"""
-        print("\n📜 HISTORIAL DE EVENTOS")
-        print("-" * 60)
+        out = ["\n📜 HISTORIAL DE EVENTOS", "-" * 60]
 
-        response = self.send_command("LOG")
+        response = self.cached_command("LOG")
 
-        if response.startswith("OK LOG"):
-            lines = response.split("\n")[1:]  # Saltar primera línea "OK LOG"
+        ok, tail = _parse_reply(response)
+        header, _, body = tail.partition("\n")  # Saltar cabecera "OK LOG <n>"
+        if ok and header.startswith("LOG"):
+            lines = body.split("\n") if body else []
             if lines:
-                for line in lines:
-                    if line.strip():
-                        print(f"  {line}")
+                out.extend(f"  {line}" for line in lines if line.strip())
             else:
-                print("  (Sin eventos registrados)")
+                out.append("  (Sin eventos registrados)")
         else:
-            print(f"❌ {response}")
+            out.append(f"❌ {response}")
 
-        print()
+        # Una única escritura por listado en lugar de un print() por evento
+        out.append("\n")
+        sys.stdout.write("\n".join(out))
+        sys.stdout.flush()
 
     def send_custom_command(self):
         """Permite enviar un comando personalizado"""
         print("\n⌨️  COMANDO PERSONALIZADO")
         print("-" * 60)
 
-        command = input("Comando: ").strip()
+        command = _prompt("Comando: ").strip()
         if not command:
             print("❌ Comando vacío")
             return
@@ -453,37 +911,72 @@ class DomoticClient:
         response = self.send_command(command)
         print(f"\n📡 Respuesta:\n{response}\n")
 
+    def run_batch_file(self):
+        """Ejecuta los comandos de un archivo (uno por línea) en una sola ráfaga"""
+        print("\n📂 EJECUTAR COMANDOS DESDE ARCHIVO")
+        print("-" * 60)
+
+        path = _prompt("Ruta del archivo: ").strip()
+        if not path:
+            print("❌ Ruta vacía")
+            return
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                commands = [
+                    line.strip()
+                    for line in f
+                    if line.strip() and not line.lstrip().startswith("#")
+                ]
+        except OSError as e:
+            print(f"❌ No se pudo leer el archivo: {e}")
+            return
+
+        if not commands:
+            print("❌ El archivo no contiene comandos")
+            return
+
+        responses = self.send_commands(commands)
+        out = [f"\n📡 {len(commands)} comandos enviados:"]
+        for command, response in zip(commands, responses):
+            out.append(f"  > {command}")
+            out.extend(f"  < {line}" for line in response.split("\n"))
+        out.append("\n")
+        sys.stdout.write("\n".join(out))
+
     def show_menu(self):
         """Muestra el menú principal"""
         status_auth = (
             f"✅ {self.username}" if self.authenticated else "❌ No autenticado"
         )
 
-        print("\n" + "=" * 60)
-        print("               SISTEMA DOMÓTICO - CLIENTE")
-        print("=" * 60)
-        print(f"Servidor: {self.host}:{self.port}")
-        print(f"Estado: {'🟢 Conectado' if self.connected else '🔴 Desconectado'}")
-        print(f"Autenticación: {status_auth}")
-        print("=" * 60)
-        print("\n📋 MENÚ DE OPCIONES:")
-        print()
-        print("  1. 🔐 Login (Autenticación)")
-        print("  2. 📋 Listar todos los dispositivos")
-        print("  3. 📊 Ver estado de un dispositivo")
-        print("  4. 💡 Encender/Apagar dispositivo (requiere login)")
-        print("  5. ⏰ Configurar auto-apagado (requiere login)")
-        print("  6. 📜 Ver historial de eventos")
-        print("  7. ⌨️  Enviar comando personalizado")
-        print("  8. 🔄 Reconectar al servidor")
-        print("  0. ❌ Salir")
-        print()
+        sys.stdout.write(
+            _MENU_TEMPLATE.format(
+                host=self.host,
+                port=self.port,
+                status="🟢 Conectado" if self.connected else "🔴 Desconectado",
+                auth=status_auth,
+                telemetry=self.telemetry.summary(),
+            )
+        )
+        sys.stdout.flush()
 
     def reconnect(self):
-        """Reconecta al servidor"""
+        """Reconecta al servidor (solo si la conexión actual ya no sirve)"""
+        # Sondeo sin bloqueo: si el socket sigue sano no se repite el handshake
+        self.poll_server()
+        if self.connected:
+            print("\n✅ La conexión con el servidor sigue activa\n")
+            return
+
         print("\n🔄 Reconectando...")
+        self._close_selector()
         if self.socket:
             try:
+                # La conexión ya está muerta: abortarla en lugar de cerrarla
+                self.socket.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_ABORT
+                )
                 self.socket.close()
             except Exception:
                 pass
@@ -505,29 +998,20 @@ class DomoticClient:
             print("   python server_domotico.py\n")
             return
 
+        # Telemetría UDP en paralelo con la sesión TCP
+        self.telemetry.start()
+
         # Menú interactivo
         while True:
+            self.poll_server()
             self.show_menu()
 
             try:
-                opcion = input("Seleccione una opción: ").strip()
-
-                if opcion == "1":
-                    self.login()
-                elif opcion == "2":
-                    self.list_devices()
-                elif opcion == "3":
-                    self.get_status()
-                elif opcion == "4":
-                    self.set_device()
-                elif opcion == "5":
-                    self.set_auto_off()
-                elif opcion == "6":
-                    self.view_log()
-                elif opcion == "7":
-                    self.send_custom_command()
-                elif opcion == "8":
-                    self.reconnect()
+                opcion = _prompt("Seleccione una opción: ").strip()
+
+                action = self._actions.get(opcion)
+                if action is not None:
+                    action()
                 elif opcion == "0":
                     print("\n👋 Cerrando cliente...\n")
                     break
@@ -535,8 +1019,8 @@ class DomoticClient:
                     print("\n❌ Opción no válida\n")
 
                 # Pausa para leer la salida
-                if opcion in ["1", "2", "3", "4", "5", "6", "7"]:
-                    input("\nPresione Enter para continuar...")
+                if opcion in _PAUSE_OPTIONS:
+                    _prompt("\nPresione Enter para continuar...")
 
             except KeyboardInterrupt:
                 print("\n\n👋 Interrumpido por el usuario\n")
@@ -545,10 +1029,11 @@ class DomoticClient:
                 print("\n\n👋 Cerrando cliente...\n")
                 break
 
-        # Cerrar conexión
+        # Cerrar telemetría y conexión
+        self.telemetry.stop()
         if self.socket:
             try:
-                self.send_command("EXIT")
+                self.send_command("EXIT", timeout=2)
                 self.socket.close()
             except Exception:
                 pass
@@ -557,6 +1042,7 @@ class DomoticClient:
 
     def disconnect(self):
         """Cierra la conexión"""
+        self._close_selector()
         if self.socket:
             try:
                 self.socket.close()
@@ -566,11 +1052,99 @@ class DomoticClient:
         self.authenticated = False
 
 
+# ==================== UTILIDADES DE CONSOLA ====================
+def _enable_windows_ansi():
+    """Activa el procesamiento de secuencias ANSI en la consola de Windows 10+"""
+    try:
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+        mode = ctypes.c_uint32()
+        if kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+            # ENABLE_VIRTUAL_TERMINAL_PROCESSING
+            kernel32.SetConsoleMode(handle, mode.value | 0x0004)
+    except Exception:
+        pass
+
+
+def _complete(text: str, state: int):
+    """Completer de readline: comandos e IDs que empiezan por el texto"""
+    prefix = text.lower()
+    matches = [w + " " for w in _COMPLETION_WORDS if w.lower().startswith(prefix)]
+    return matches[state] if state < len(matches) else None
+
+
+def setup_readline():
+    """Activa historial persistente y autocompletado con tabulador"""
+    if readline is None:
+        return
+
+    try:
+        readline.read_history_file(HISTORY_FILE)
+    except OSError:
+        pass
+    readline.set_history_length(HISTORY_LENGTH)
+    atexit.register(_save_history)
+
+    readline.set_completer(_complete)
+    if "libedit" in (readline.__doc__ or ""):
+        readline.parse_and_bind("bind ^I rl_complete")  # macOS
+    else:
+        readline.parse_and_bind("tab: complete")
+
+
+def _save_history():
+    """Guarda el historial al salir"""
+    try:
+        readline.write_history_file(HISTORY_FILE)
+    except OSError:
+        pass
+
+
+def _parse_reply(response: str):
+    """Separa una respuesta en (ok, resto): "OK 5 ..." -> (True, "5 ...")"""
+    verb, _, tail = response.partition(" ")
+    return verb == "OK", tail
+
+
+def _prompt(message: str) -> str:
+    """
+    Lee una línea de la entrada. En un terminal usa input() para conservar
+    la edición de línea, el historial y el Tab de readline; con la entrada
+    redirigida escribe el prompt y lee directamente de sys.stdin.
+    """
+    if _STDIN_IS_TTY:
+        return input(message)
+    sys.stdout.write(message)
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError
+    return line.rstrip("\n")
+
+
+def _forget_last_input():
+    """Elimina del historial la última línea introducida"""
+    if readline is not None:
+        length = readline.get_current_history_length()
+        if length > 0:
+            readline.remove_history_item(length - 1)
+
+
+def clear_screen():
+    """Limpia la consola con una secuencia ANSI, sin lanzar un proceso externo"""
+    if os.name == "nt":
+        _enable_windows_ansi()
+    sys.stdout.write(CLEAR_SCREEN)
+    sys.stdout.flush()
+
+
 # ==================== PUNTO DE ENTRADA ====================
 def main():
     """Función principal"""
     # Limpiar consola
-    os.system("cls" if os.name == "nt" else "clear")
+    clear_screen()
 
     # Obtener host y puerto desde argumentos o usar valores por defecto
     host = DEFAULT_HOST
@@ -591,6 +1165,9 @@ def main():
     print("=" * 60)
     print(f"\nConectando a: {host}:{port}\n")
 
+    # Historial y autocompletado para los prompts
+    setup_readline()
+
     # Crear y ejecutar cliente
     client = DomoticClient(host, port)
 
@@ -11,61 +11,157 @@ Uso: python udp_listener.py [puerto]
 
 import socket
 import json
+import struct
 import sys
+import time
+from collections import ChainMap
 from datetime import datetime
 
-DEFAULT_PORT = 5001
+# Parser JSON en C si está instalado; ambos aceptan bytes sin decodificar
+try:
+    import orjson
 
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
-def format_devices_table(devices):
-    """Formatea los dispositivos en una tabla legible"""
-    lines = []
+# Telemetría en msgpack (TELEMETRY_FORMAT=msgpack en el servidor)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
-    # Encabezado
-    header = f"{'ID':<20} {'Tipo':<12} {'Estado':<8} {'Auto-Off':<10} {'Parámetros'}"
-    lines.append(header)
-    lines.append("=" * 100)
+# Telemetría binaria (TELEMETRY_FORMAT=bin): mismo formato que el servidor
+TELEMETRY_MAGIC = b"B"
+TELEMETRY_HEADER = struct.Struct(">cdB")
+TELEMETRY_RECORD = struct.Struct(">B32sBIB3sBhh")
+_TYPES = ("luz", "enchufe", "cortinas", "termostato")
+_ESTADOS = ("OFF", "ON", "N/A")
 
-    for device in devices:
-        dev_id = device["id"]
-        dev_type = device["type"]
+DEFAULT_PORT = 5001
+RCVBUF_SIZE = 1 << 20  # 1 MiB: absorbe ráfagas mientras se imprime la tabla
+DATAGRAM_SIZE = 4096
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Paquetes sin cambios tras los que se vuelve a dibujar igualmente la tabla
+UNCHANGED_REDRAW = 15
+# Lectura sin bloqueo por llamada (POSIX); en Windows se lee de uno en uno
+_MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", None)
+
+
+# Plantillas de la tabla (se construyen una sola vez)
+_ROW_FMT = "{:<20} {:<12} {:<8} {:<10} {}"
+_TABLE_HEADER = _ROW_FMT.format("ID", "Tipo", "Estado", "Auto-Off", "Parámetros")
+_PARAMS_FMT = {
+    "luz": "Brillo: {brightness}% | Color: {color}",
+    "cortinas": "Posición: {curtains}%",
+    "termostato": "Actual: {temperature}°C | Objetivo: {target_temperature}°C",
+}
+# Valores si el paquete no trae el campo (p. ej. un servidor más antiguo)
+_PARAM_DEFAULTS = {
+    "brightness": 0,
+    "color": "#ffffff",
+    "curtains": 0,
+    "temperature": 0,
+    "target_temperature": 0,
+}
+# Tipos sin estado ON/OFF ni auto-off
+_NO_STATE_TYPES = frozenset({"cortinas", "termostato"})
+
+
+def _format_device_row(device):
+    """Fila de la tabla para un dispositivo"""
+    dev_type = device["type"]
+
+    # Parámetros específicos según tipo
+    params_fmt = _PARAMS_FMT.get(dev_type)
+    params_str = (
+        params_fmt.format_map(ChainMap(device, _PARAM_DEFAULTS)) if params_fmt else "--"
+    )
+
+    if dev_type in _NO_STATE_TYPES:
+        estado = auto_off_str = "--"
+    else:
         estado = device.get("estado", "N/A")
         auto_off = device.get("auto_off", 0)
-
-        # Auto-off solo si aplica
         auto_off_str = f"{auto_off}s" if auto_off > 0 else "--"
 
-        # Parámetros específicos según tipo
-        params = []
-
-        if dev_type == "luz":
-            brightness = device.get("brightness", 0)
-            color = device.get("color", "#ffffff")
-            params.append(f"Brillo: {brightness}%")
-            params.append(f"Color: {color}")
-
-        elif dev_type == "cortinas":
-            curtains = device.get("curtains", 0)
-            params.append(f"Posición: {curtains}%")
-            estado = "--"  # Cortinas no tienen estado ON/OFF
-            auto_off_str = "--"
+    return _ROW_FMT.format(device["id"], dev_type, estado, auto_off_str, params_str)
 
-        elif dev_type == "termostato":
-            temp = device.get("temperature", 0)
-            target_temp = device.get("target_temperature", 0)
-            params.append(f"Actual: {temp}°C")
-            params.append(f"Objetivo: {target_temp}°C")
-            estado = "--"  # Termostato no tiene estado ON/OFF
-            auto_off_str = "--"
 
-        params_str = " | ".join(params) if params else "--"
+def format_devices_table(devices):
+    """Formatea los dispositivos en una tabla legible"""
+    return "\n".join([_TABLE_HEADER, "=" * 100, *map(_format_device_row, devices)])
+
+
+def _tenths(value: int):
+    """Décimas de grado a número (entero si no tiene parte decimal)"""
+    return value // 10 if value % 10 == 0 else value / 10
+
+
+def decode_binary_telemetry(data: bytes) -> dict:
+    """Decodifica un paquete binario al mismo diccionario que el JSON"""
+    _, timestamp, _ = TELEMETRY_HEADER.unpack_from(data)
+    devices = [
+        {
+            "id": dev_id.rstrip(b"\0").decode("utf-8"),
+            "type": _TYPES[type_code],
+            "estado": _ESTADOS[estado],
+            "auto_off": auto_off,
+            "brightness": brightness,
+            "color": "#" + color.hex(),
+            "curtains": curtains,
+            "temperature": _tenths(temp),
+            "target_temperature": _tenths(target_temp),
+        }
+        for (
+            type_code,
+            dev_id,
+            estado,
+            auto_off,
+            brightness,
+            color,
+            curtains,
+            temp,
+            target_temp,
+        ) in TELEMETRY_RECORD.iter_unpack(memoryview(data)[TELEMETRY_HEADER.size :])
+    ]
+    return {
+        "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+        "devices": devices,
+    }
+
+
+def decode_telemetry(data: bytes) -> dict:
+    """
+    Decodifica un paquete de telemetría. Los paquetes JSON empiezan por "{"
+    y los binarios por TELEMETRY_MAGIC; cualquier otro se interpreta como
+    msgpack (si está instalado).
+    """
+    first = data[:1]
+    if first == TELEMETRY_MAGIC:
+        return decode_binary_telemetry(data)
+    if first == b"{" or msgpack is None:
+        return json_loads(data)
+    return msgpack.unpackb(data, raw=False)
 
-        line = (
-            f"{dev_id:<20} {dev_type:<12} {estado:<8} {auto_off_str:<10} {params_str}"
-        )
-        lines.append(line)
 
-    return "\n".join(lines)
+def recv_batch(sock, buf):
+    """
+    Espera al siguiente datagrama y, sin volver a bloquear, lee también los
+    que ya estén en el buffer del kernel, todos sobre el mismo buffer
+    preasignado (solo interesa el último).
+    Retorna (datagramas leídos, bytes del último, origen del último).
+    """
+    nbytes, addr = sock.recvfrom_into(buf)
+    count = 1
+    if _MSG_DONTWAIT is not None:
+        try:
+            while True:
+                nbytes, addr = sock.recvfrom_into(buf, 0, _MSG_DONTWAIT)
+                count += 1
+        except BlockingIOError:
+            pass
+    return count, nbytes, addr
 
 
 def listen_udp_telemetry(port):
@@ -83,23 +179,39 @@ def listen_udp_telemetry(port):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-    # Permitir broadcast
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    # Buffer de recepción amplio (SO_BROADCAST no hace falta para recibir)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
 
     # Bind al puerto
     sock.bind(("", port))
 
     packet_count = 0
+    buf = memoryview(bytearray(DATAGRAM_SIZE))  # Sin reservas por datagrama
+    last_devices = None  # Bytes de "devices" del último paquete dibujado
+    unchanged = 0
 
     try:
         while True:
-            # Recibir datos
-            data, addr = sock.recvfrom(4096)
-            packet_count += 1
+            # Recibir datos (el siguiente datagrama y los ya encolados); las
+            # instantáneas atrasadas se cuentan pero solo se dibuja la última
+            count, nbytes, addr = recv_batch(sock, buf)
+            packet_count += count
+            data = bytes(buf[:nbytes])
+
+            # Si la lista de dispositivos es idéntica byte a byte (solo cambia
+            # el timestamp inicial) no se decodifica ni se vuelve a dibujar
+            if data[:1] == TELEMETRY_MAGIC:
+                devices_bytes = data[TELEMETRY_HEADER.size :]
+            else:
+                idx = data.find(b"devices")
+                devices_bytes = data[idx:] if idx >= 0 else data
+            if devices_bytes == last_devices and unchanged < UNCHANGED_REDRAW:
+                unchanged += count
+                continue
 
             try:
                 # Decodificar JSON
-                payload = json.loads(data.decode("utf-8"))
+                payload = decode_telemetry(data)
 
                 # Timestamp del servidor
                 server_time = payload.get("timestamp", "N/A")
@@ -108,25 +220,30 @@ def listen_udp_telemetry(port):
                 # Limpiar pantalla (comentar si no deseas limpiar)
                 # print('\033[2J\033[H', end='')
 
-                # Mostrar información
-                print("\n" + "=" * 100)
-                print(
-                    f"Paquete #{packet_count} | Origen: {addr[0]}:{addr[1]} | Timestamp: {server_time}"
-                )
-                print(f"Total dispositivos: {len(devices)}")
-                print("=" * 100)
-
-                if devices:
-                    print("\n" + format_devices_table(devices))
-                else:
-                    print("\nNo hay dispositivos registrados")
-
-                print("\n" + "=" * 100)
-                local_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"Recibido localmente: {local_time}")
-                print()
-
-            except json.JSONDecodeError:
+                # Mostrar información (un único write por paquete)
+                local_time = time.strftime(TIME_FORMAT)
+                out = [
+                    "",
+                    "=" * 100,
+                    f"Paquete #{packet_count} | Origen: {addr[0]}:{addr[1]} | Timestamp: {server_time}",
+                    f"Total dispositivos: {len(devices)}"
+                    + (f" | Sin cambios en {unchanged} paquetes" if unchanged else ""),
+                    "=" * 100,
+                    "",
+                    format_devices_table(devices)
+                    if devices
+                    else "No hay dispositivos registrados",
+                    "",
+                    "=" * 100,
+                    f"Recibido localmente: {local_time}",
+                    "\n",
+                ]
+                sys.stdout.write("\n".join(out))
+                sys.stdout.flush()
+                last_devices = devices_bytes
+                unchanged = 0
+
+            except json.JSONDecodeError:  # orjson.JSONDecodeError es subclase
                 print(f"Error decodificando JSON desde {addr}")
             except Exception as e:
                 print(f"Error procesando paquete: {e}")
@@ -11,16 +11,57 @@ Requisitos: El servidor debe estar ejecutándose antes de lanzar este script.
 Uso: python test_sistema.py
 """
 
+import io
+import json
+import os
+import select
 import socket
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 
+# Parser JSON en C si está instalado; ambos aceptan los bytes de la respuesta
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # Configuración
 TCP_HOST = "localhost"
 TCP_PORT = 5000
 API_BASE = "http://localhost:8080/api"
 
+# Timeouts de las pruebas: la API local responde en milisegundos, así que un
+# fallo debe notarse en seguida. (conexión, lectura) para requests; la sesión
+# TCP pasa de 5 s en el connect a TCP_TIMEOUT tras el login.
+API_TIMEOUT = (0.5, 1.0)
+TCP_TIMEOUT = 1.5
+
+# Comprobación previa: si el servidor no responde en este tiempo, se aborta la
+# suite en lugar de esperar el timeout de cada prueba
+PREFLIGHT_TIMEOUT = 0.5
+
+# Prueba de concurrencia: peticiones simultáneas y rendimiento mínimo exigido
+CONCURRENT_REQUESTS = 50
+CONCURRENT_WORKERS = 10
+MIN_THROUGHPUT_RPS = 20
+
+# Opciones de los sockets TCP de prueba: comandos cortos sin esperar a Nagle
+SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+]
+
+# Tamaño del buffer de lectura/escritura de cada conexión TCP: el lector lo
+# reutiliza entre comandos, así que una sola lectura trae LOG completo
+TCP_BUFFER_SIZE = 8192
+
 # Colores ANSI para output
 GREEN = "\033[92m"
 RED = "\033[91m"
@@ -29,42 +70,138 @@ BLUE = "\033[94m"
 RESET = "\033[0m"
 
 
+@lru_cache(maxsize=None)
+def encode_command(command):
+    """Bytes de un comando TCP con su salto de línea (las pruebas repiten
+    siempre los mismos comandos, p. ej. STATUS en el sondeo de autoapagado)"""
+    return (command + "\n").encode("utf-8")
+
+
 class TestRunner:
     """Ejecutor de pruebas del sistema domótico"""
 
+    # Fragmentos de salida con color, construidos una sola vez
+    HEADER_BAR = f"{BLUE}{'=' * 70}{RESET}"
+    PASS_PREFIX = f"{GREEN}✅ PASS{RESET} - "
+    FAIL_PREFIX = f"{RED}❌ FAIL{RESET} - "
+
     def __init__(self):
         self.tests_passed = 0
         self.tests_failed = 0
         self.tcp_socket = None
+        self.tcp_file = None  # Lector/escritor con buffer sobre tcp_socket
+
+        # Sesión HTTP compartida: reutiliza conexiones keep-alive con la API
+        self.http = requests.Session()
+        self.http.mount(
+            "http://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=0)
+        )
+
+        # Pool de hilos compartido por todas las pruebas que lanzan peticiones
+        # en paralelo (se crea una vez y se cierra en cleanup)
+        self._pool = ThreadPoolExecutor(max_workers=CONCURRENT_WORKERS)
+
+        # Tests en paralelo: contadores protegidos y salida capturada por hilo
+        self._count_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _write(self, text):
+        """Escribe en la salida capturada del hilo, si la hay, o en stdout"""
+        getattr(self._local, "buffer", sys.stdout).write(text)
+
+    def run_captured(self, test):
+        """Ejecuta un test capturando su salida; retorna el texto producido"""
+        self._local.buffer = io.StringIO()
+        try:
+            test()
+            return self._local.buffer.getvalue()
+        finally:
+            del self._local.buffer
 
     def print_header(self, text):
         """Imprime encabezado de sección"""
-        print(f"\n{BLUE}{'=' * 70}{RESET}")
-        print(f"{BLUE}{text.center(70)}{RESET}")
-        print(f"{BLUE}{'=' * 70}{RESET}\n")
+        bar = self.HEADER_BAR
+        self._write(f"\n{bar}\n{BLUE}{text.center(70)}{RESET}\n{bar}\n\n")
 
     def print_test(self, name, passed, details=""):
         """Imprime resultado de un test"""
-        if passed:
-            print(f"{GREEN}✅ PASS{RESET} - {name}")
-            if details:
-                print(f"         {details}")
-            self.tests_passed += 1
+        prefix = self.PASS_PREFIX if passed else self.FAIL_PREFIX
+        if details:
+            self._write(f"{prefix}{name}\n         {details}\n")
         else:
-            print(f"{RED}❌ FAIL{RESET} - {name}")
-            if details:
-                print(f"         {details}")
-            self.tests_failed += 1
+            self._write(f"{prefix}{name}\n")
+        with self._count_lock:
+            if passed:
+                self.tests_passed += 1
+            else:
+                self.tests_failed += 1
+
+    def open_tcp_socket(self):
+        """Crea un socket TCP con SOCKET_OPTIONS y lo conecta al servidor"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        for level, option, value in SOCKET_OPTIONS:
+            sock.setsockopt(level, option, value)
+        sock.settimeout(5)
+        sock.connect((TCP_HOST, TCP_PORT))
+        return sock
+
+    def open_probe_socket(self, timeout=1.0):
+        """
+        Abre una conexión de corta duración sin bloquear en connect():
+        connect_ex no bloqueante y espera de escritura con select.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        for level, option, value in SOCKET_OPTIONS:
+            sock.setsockopt(level, option, value)
+        sock.setblocking(False)
+        sock.connect_ex((TCP_HOST, TCP_PORT))
+        _, writable, _ = select.select([], [sock], [], timeout)
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if not writable or error:
+            sock.close()
+            raise ConnectionError(
+                f"No se pudo conectar a {TCP_HOST}:{TCP_PORT} "
+                f"({os.strerror(error) if error else 'timeout'})"
+            )
+        sock.settimeout(5)
+        return sock
+
+    @staticmethod
+    def read_welcome(tcp_file):
+        """Lee el mensaje de bienvenida (termina con una línea vacía)"""
+        lines = []
+        while True:
+            line = tcp_file.readline()
+            if not line.strip():
+                return "".join(lines)
+            lines.append(line.decode("utf-8"))
+
+    @staticmethod
+    def exchange(tcp_file, command):
+        """
+        Envía un comando y lee exactamente su respuesta, línea a línea: una
+        línea, salvo LOG ("OK LOG <n>" seguido de n líneas).
+        """
+        tcp_file.write(encode_command(command))
+        tcp_file.flush()
+        response = tcp_file.readline().decode("utf-8").strip()
+        parts = response.split()
+        if parts[:2] == ["OK", "LOG"] and len(parts) > 2:
+            lines = [
+                tcp_file.readline().decode("utf-8").strip()
+                for _ in range(int(parts[2]))
+            ]
+            response = "\n".join([response, *lines])
+        return response
 
     def connect_tcp(self):
         """Conecta al servidor TCP"""
         try:
-            self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.tcp_socket.settimeout(5)
-            self.tcp_socket.connect((TCP_HOST, TCP_PORT))
+            self.tcp_socket = self.open_tcp_socket()
+            self.tcp_file = self.tcp_socket.makefile("rwb", buffering=TCP_BUFFER_SIZE)
 
             # Leer mensaje de bienvenida
-            welcome = self.tcp_socket.recv(4096).decode("utf-8")
+            welcome = self.read_welcome(self.tcp_file)
             return True, welcome
         except Exception as e:
             return False, str(e)
@@ -72,12 +209,42 @@ class TestRunner:
     def send_tcp_command(self, command):
         """Envía comando TCP y retorna respuesta"""
         try:
-            self.tcp_socket.send((command + "\n").encode("utf-8"))
-            response = self.tcp_socket.recv(4096).decode("utf-8").strip()
-            return response
+            return self.exchange(self.tcp_file, command)
         except Exception as e:
             return f"ERROR: {e}"
 
+    def wait_for_state(self, device_id, expected, timeout, interval=0.1):
+        """
+        Consulta STATUS cada interval segundos hasta que el dispositivo esté
+        en el estado esperado o venza el timeout.
+        Retorna (alcanzado, última respuesta, segundos transcurridos).
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            response = self.send_tcp_command(f"STATUS {device_id}")
+            parts = response.split()
+            if len(parts) >= 3 and parts[0] == "OK" and parts[2] == expected:
+                return True, response, time.monotonic() - start
+            if time.monotonic() >= deadline:
+                return False, response, time.monotonic() - start
+            time.sleep(interval)
+
+    def _preflight(self):
+        """
+        Comprueba rápidamente que el servidor TCP y la API responden.
+        Retorna (ok, motivo del fallo).
+        """
+        try:
+            self.open_probe_socket(timeout=PREFLIGHT_TIMEOUT).close()
+        except OSError as e:
+            return False, str(e)
+        try:
+            self.http.get(f"{API_BASE}/status", timeout=PREFLIGHT_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            return False, f"API {API_BASE}: {e}"
+        return True, ""
+
     def test_tcp_connection(self):
         """Test 1: Conexión TCP básica"""
         self.print_header("TEST 1: CONEXIÓN TCP")
@@ -100,6 +267,7 @@ class TestRunner:
         self.print_test(
             "LOGIN con credenciales válidas", response.startswith("OK LOGIN"), response
         )
+        self.tcp_socket.settimeout(TCP_TIMEOUT)
 
         # Test LIST
         response = self.send_tcp_command("LIST")
@@ -121,8 +289,6 @@ class TestRunner:
         response = self.send_tcp_command("SET luz_salon ON")
         self.print_test("SET - Encender luz_salon", "OK SET" in response, response)
 
-        time.sleep(0.5)
-
         # Test SET OFF
         response = self.send_tcp_command("SET luz_salon OFF")
         self.print_test("SET - Apagar luz_salon", "OK SET" in response, response)
@@ -138,22 +304,23 @@ class TestRunner:
         self.print_test(
             "LOG - Obtener historial",
             "OK LOG" in response,
-            f"{len(response.split(chr(10)))} líneas de log",
+            f"{response.count(chr(10)) + 1} líneas de log",
         )
 
     def test_tcp_authentication(self):
         """Test 3: Autenticación"""
         self.print_header("TEST 3: AUTENTICACIÓN")
 
-        # Crear nueva conexión sin login
-        test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        test_socket.settimeout(5)
-        test_socket.connect((TCP_HOST, TCP_PORT))
-        test_socket.recv(4096)  # Leer bienvenida
+        # Crear nueva conexión sin login y enviar ambos comandos de golpe, sin
+        # esperar a la bienvenida: el servidor los procesa en orden
+        test_socket = self.open_probe_socket()
+        test_file = test_socket.makefile("rwb", buffering=TCP_BUFFER_SIZE)
+        test_file.write(b"SET luz_salon ON\nLOGIN admin wrong_password\n")
+        test_file.flush()
+        self.read_welcome(test_file)
 
         # Intentar SET sin login
-        test_socket.send(b"SET luz_salon ON\n")
-        response = test_socket.recv(4096).decode("utf-8").strip()
+        response = test_file.readline().decode("utf-8").strip()
 
         self.print_test(
             "SET sin autenticación debe fallar",
@@ -162,13 +329,13 @@ class TestRunner:
         )
 
         # Login con credenciales incorrectas
-        test_socket.send(b"LOGIN admin wrong_password\n")
-        response = test_socket.recv(4096).decode("utf-8").strip()
+        response = test_file.readline().decode("utf-8").strip()
 
         self.print_test(
             "LOGIN con contraseña incorrecta debe fallar", "ERROR" in response, response
         )
 
+        test_file.close()
         test_socket.close()
 
     def test_api_endpoints(self):
@@ -176,9 +343,36 @@ class TestRunner:
         self.print_header("TEST 4: API REST - ENDPOINTS")
 
         try:
+            # Las consultas independientes (status, auto_off, log) salen a la
+            # vez por la sesión compartida; la pareja ON -> OFF, que sí depende
+            # del orden, se ejecuta mientras tanto en este hilo
+            status_future = self._pool.submit(
+                self.http.get, f"{API_BASE}/status", timeout=API_TIMEOUT
+            )
+            auto_off_future = self._pool.submit(
+                self.http.post,
+                f"{API_BASE}/auto_off",
+                json={"id": "luz_salon", "seconds": 10},
+                timeout=API_TIMEOUT,
+            )
+            log_future = self._pool.submit(
+                self.http.get, f"{API_BASE}/log?limit=10", timeout=API_TIMEOUT
+            )
+
+            control_on = self.http.post(
+                f"{API_BASE}/control",
+                json={"id": "enchufe_tv", "action": "ON"},
+                timeout=API_TIMEOUT,
+            )
+            control_off = self.http.post(
+                f"{API_BASE}/control",
+                json={"id": "enchufe_tv", "action": "OFF"},
+                timeout=API_TIMEOUT,
+            )
+
             # Test GET /api/status
-            response = requests.get(f"{API_BASE}/status", timeout=5)
-            data = response.json()
+            response = status_future.result()
+            data = json_loads(response.content)
 
             self.print_test(
                 "GET /api/status",
@@ -187,12 +381,8 @@ class TestRunner:
             )
 
             # Test POST /api/control - Encender
-            response = requests.post(
-                f"{API_BASE}/control",
-                json={"id": "enchufe_tv", "action": "ON"},
-                timeout=5,
-            )
-            data = response.json()
+            response = control_on
+            data = json_loads(response.content)
 
             self.print_test(
                 "POST /api/control - Encender enchufe_tv",
@@ -200,15 +390,9 @@ class TestRunner:
                 f"Estado: {data.get('new_state', 'N/A')}",
             )
 
-            time.sleep(0.5)
-
             # Test POST /api/control - Apagar
-            response = requests.post(
-                f"{API_BASE}/control",
-                json={"id": "enchufe_tv", "action": "OFF"},
-                timeout=5,
-            )
-            data = response.json()
+            response = control_off
+            data = json_loads(response.content)
 
             self.print_test(
                 "POST /api/control - Apagar enchufe_tv",
@@ -217,12 +401,8 @@ class TestRunner:
             )
 
             # Test POST /api/auto_off
-            response = requests.post(
-                f"{API_BASE}/auto_off",
-                json={"id": "luz_salon", "seconds": 10},
-                timeout=5,
-            )
-            data = response.json()
+            response = auto_off_future.result()
+            data = json_loads(response.content)
 
             self.print_test(
                 "POST /api/auto_off - Programar autoapagado",
@@ -231,8 +411,8 @@ class TestRunner:
             )
 
             # Test GET /api/log
-            response = requests.get(f"{API_BASE}/log?limit=10", timeout=5)
-            data = response.json()
+            response = log_future.result()
+            data = json_loads(response.content)
 
             self.print_test(
                 "GET /api/log",
@@ -247,60 +427,56 @@ class TestRunner:
         """Test 5: Funcionalidad de autoapagado"""
         self.print_header("TEST 5: AUTOAPAGADO AUTOMÁTICO")
 
-        print(f"{YELLOW}ℹ️  Este test toma 6+ segundos...{RESET}\n")
+        self._write(f"{YELLOW}ℹ️  Este test toma unos 5 segundos...{RESET}\n\n")
 
-        # Encender dispositivo
+        # Encender dispositivo y verificar que está encendido
         self.send_tcp_command("SET enchufe_calefactor ON")
-        time.sleep(0.5)
-
-        # Verificar que está encendido
-        response = self.send_tcp_command("STATUS enchufe_calefactor")
-        initial_on = "ON" in response
+        initial_on, response, _ = self.wait_for_state(
+            "enchufe_calefactor", "ON", timeout=0.2
+        )
 
         self.print_test("Dispositivo encendido inicialmente", initial_on, response)
 
-        # Programar autoapagado de 5 segundos
+        # Programar autoapagado de 5 segundos y esperar (máximo 6 s) a que se
+        # apague, comprobando el estado en lugar de dormir un tiempo fijo
         self.send_tcp_command("AUTO_OFF enchufe_calefactor 5")
-        print(f"{YELLOW}⏳ Esperando 6 segundos para autoapagado...{RESET}")
-        time.sleep(6)
-
-        # Verificar que se apagó
-        response = self.send_tcp_command("STATUS enchufe_calefactor")
-        auto_off_worked = "OFF" in response
+        self._write(
+            f"{YELLOW}⏳ Esperando el autoapagado (máximo 6 segundos)...{RESET}\n"
+        )
+        auto_off_worked, response, elapsed = self.wait_for_state(
+            "enchufe_calefactor", "OFF", timeout=6
+        )
 
         self.print_test(
-            "Dispositivo se apagó automáticamente tras 5s", auto_off_worked, response
+            "Dispositivo se apagó automáticamente tras 5s",
+            auto_off_worked,
+            f"{response} ({elapsed:.2f}s)",
         )
 
-    def test_concurrent_operations(self):
-        """Test 6: Operaciones concurrentes"""
+    def test_concurrent_operations(self, n=CONCURRENT_REQUESTS):
+        """Test 6: Operaciones concurrentes (n peticiones, mide peticiones/s)"""
         self.print_header("TEST 6: CONCURRENCIA")
 
         try:
-            # Realizar múltiples operaciones simultáneas vía API
-            import threading
-
-            results = []
-
-            def api_call():
+            # Realizar múltiples operaciones simultáneas vía API, con el pool
+            # de hilos compartido sobre la sesión (conexiones ya abiertas)
+            def api_call(_):
                 try:
-                    r = requests.get(f"{API_BASE}/status", timeout=5)
-                    results.append(r.status_code == 200)
+                    r = self.http.get(f"{API_BASE}/status", timeout=API_TIMEOUT)
+                    return r.status_code == 200
                 except Exception:
-                    results.append(False)
-
-            threads = [threading.Thread(target=api_call) for _ in range(5)]
+                    return False
 
-            for t in threads:
-                t.start()
-
-            for t in threads:
-                t.join()
+            t0 = time.perf_counter()
+            results = list(self._pool.map(api_call, range(n)))
+            elapsed = time.perf_counter() - t0
 
+            rps = n / elapsed if elapsed > 0 else float("inf")
             self.print_test(
-                "5 llamadas API concurrentes",
-                all(results),
-                f"{sum(results)}/5 exitosas",
+                f"{n} llamadas API concurrentes",
+                all(results) and rps >= MIN_THROUGHPUT_RPS,
+                f"{sum(results)}/{n} exitosas | {rps:.0f} peticiones/s "
+                f"(mínimo {MIN_THROUGHPUT_RPS})",
             )
 
         except Exception as e:
@@ -311,18 +487,29 @@ class TestRunner:
         if self.tcp_socket:
             try:
                 self.send_tcp_command("EXIT")
+                self.tcp_file.close()
                 self.tcp_socket.close()
             except Exception:
                 pass
+        self._pool.shutdown(wait=True)
+        self.http.close()
 
     def run_all_tests(self):
         """Ejecuta todos los tests"""
-        print(f"\n{BLUE}{'=' * 70}{RESET}")
+        print(f"\n{self.HEADER_BAR}")
         print(f"{BLUE}{'SISTEMA DOMÓTICO - SUITE DE PRUEBAS'.center(70)}{RESET}")
-        print(f"{BLUE}{'=' * 70}{RESET}")
+        print(self.HEADER_BAR)
         print(f"\n{YELLOW}Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{RESET}")
         print(f"{YELLOW}Servidor: {TCP_HOST}:{TCP_PORT}{RESET}\n")
 
+        # Abortar en seguida si el servidor no está levantado
+        ok, reason = self._preflight()
+        if not ok:
+            print(f"{RED}❌ El servidor no responde: {reason}{RESET}")
+            print(f"{YELLOW}Asegúrate de ejecutar: python server_domotico.py{RESET}\n")
+            self.cleanup()
+            return
+
         # Ejecutar tests
         if not self.test_tcp_connection():
             print(f"\n{RED}❌ No se pudo conectar al servidor.{RESET}")
@@ -330,10 +517,25 @@ class TestRunner:
             return
 
         self.test_tcp_commands()
-        self.test_tcp_authentication()
-        self.test_api_endpoints()
-        self.test_auto_off_functionality()
-        self.test_concurrent_operations()
+
+        # El resto de tests no comparten estado: autenticación, API y
+        # concurrencia usan sus propias conexiones y corren en paralelo con el
+        # autoapagado (que usa la sesión TCP). La salida se muestra en orden.
+        print(f"{YELLOW}⏳ Ejecutando el resto de pruebas en paralelo...{RESET}")
+        with ThreadPoolExecutor(max_workers=3) as suite:
+            futures = [
+                suite.submit(self.run_captured, test)
+                for test in (
+                    self.test_tcp_authentication,
+                    self.test_api_endpoints,
+                    self.test_concurrent_operations,
+                )
+            ]
+            auto_off_output = self.run_captured(self.test_auto_off_functionality)
+            auth_output, api_output, concurrent_output = (
+                future.result() for future in futures
+            )
+        sys.stdout.write(auth_output + api_output + auto_off_output + concurrent_output)
 
         # Limpieza
         self.cleanup()
@@ -360,6 +562,8 @@ class TestRunner:
             print(f"{RED}{'⚠️  ALGUNAS PRUEBAS FALLARON ⚠️'.center(70)}{RESET}")
             print(f"{RED}{'=' * 70}{RESET}\n")
 
+        sys.stdout.flush()
+
 
 if __name__ == "__main__":
     runner = TestRunner()
@@ -10,21 +10,37 @@ Fecha: Noviembre 2025
 Características:
 - Gestión de dispositivos (luces y enchufes)
 - Autoapagado programable
-- Concurrencia mediante threading
+- Concurrencia mediante asyncio (TCP/UDP) y threading (API REST, timers)
 - TCP para comandos (puerto 5000)
 - UDP para telemetría broadcast (puerto 5001)
 - API REST JSON para gemelo digital (puerto 8080)
 """
 
+import asyncio
 import socket
+import gzip
+import hashlib
+import heapq
+import logging
+import logging.handlers
+import queue
+import signal
+import itertools
+from collections import deque
+import struct
 import threading
 import json
 import time
 import os
+import sys
+import re
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from werkzeug.serving import WSGIRequestHandler
 
 # Importar Google Generative AI si está disponible
 try:
@@ -35,12 +51,104 @@ except ImportError:
     GEMINI_AVAILABLE = False
     print("⚠️ google-generativeai no instalado. Chatbot deshabilitado.")
 
+# orjson para serializar JSON (API y telemetría) si está disponible (opcional)
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# msgpack para la telemetría UDP si está disponible (opcional)
+try:
+    import msgpack
+
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# uvloop como bucle de eventos de TCP/UDP si está disponible (opcional, POSIX)
+try:
+    import uvloop
+
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+# waitress como servidor WSGI de producción para la API si está disponible (opcional)
+try:
+    from waitress import serve as waitress_serve
+
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
+
 # ==================== CONFIGURACIÓN ====================
 TCP_HOST = "0.0.0.0"
 TCP_PORT = 5000
 UDP_PORT = 5001
+# Broadcast limitado explícito: el alias "<broadcast>" es propio del módulo
+# socket de CPython y no conviene depender de él con el transporte de uvloop
+UDP_BROADCAST_ADDR = "255.255.255.255"
 API_PORT = 8080
 BROADCAST_INTERVAL = 2  # segundos
+API_THREADS = int(os.environ.get("API_THREADS", "8"))  # Hilos de waitress
+API_COMPRESS_MIN_SIZE = 256  # Respuestas JSON menores se envían sin gzip
+API_MAX_BODY = 4096  # Tamaño máximo del cuerpo de una petición (413 si se supera)
+LOG_MAX_ENTRIES = 100  # Tamaño del historial de eventos
+# Eco de cada evento del historial en consola (LOG_TO_CONSOLE=0 lo desactiva)
+LOG_TO_CONSOLE = os.environ.get("LOG_TO_CONSOLE", "1") != "0"
+# Formato de la telemetría UDP: "json" (por defecto), "msgpack" o "bin"
+TELEMETRY_FORMAT = os.environ.get("TELEMETRY_FORMAT", "json").lower()
+TELEMETRY_FORMATS = frozenset({"json", "msgpack", "bin"})
+
+# Mensajes por conexión, comando y envío UDP: el hilo del bucle de eventos
+# solo encola el registro y el QueueListener de DomoticServer lo escribe
+logger = logging.getLogger("domotica")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+TCP_MAX_LINE = 4096  # Longitud máxima de un comando TCP (bytes)
+LINE_TOO_LONG_MSG = b"ERROR Comando demasiado largo"
+FRAME_HEADER = struct.Struct(">I")  # Longitud del cuerpo en modo FRAMED
+# Registro de LIST BIN: id, estado, auto_off, brillo, color RGB, cortinas,
+# temperatura y objetivo (décimas de grado)
+LIST_RECORD = struct.Struct(">32sBIB3sBhh")
+MAX_AUTO_OFF = 2**32 - 1  # auto_off viaja como entero sin signo de 32 bits
+ESTADO_CODES = {"OFF": 0, "ON": 1, "N/A": 2}
+# Telemetría binaria (TELEMETRY_FORMAT=bin): byte mágico "B", timestamp epoch
+# y número de dispositivos, seguidos de un registro por dispositivo (tipo +
+# los mismos campos que LIST_RECORD)
+TELEMETRY_MAGIC = b"B"
+TELEMETRY_HEADER = struct.Struct(">cdB")
+TELEMETRY_RECORD = struct.Struct(">B32sBIB3sBhh")
+TYPE_CODES = {"luz": 0, "enchufe": 1, "cortinas": 2, "termostato": 3}
+COLOR_RE = re.compile(r"#[0-9A-Fa-f]{6}")  # Color válido (usar con fullmatch)
+
+
+# JSON compacto en bytes (API y telemetría UDP); orjson ya produce ese formato.
+# json_loads acepta bytes sin decodificar y lanza ValueError si no es JSON
+if ORJSON_AVAILABLE:
+    json_bytes = orjson.dumps
+    json_loads = orjson.loads
+else:
+    json_loads = json.loads
+
+    def json_bytes(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+# Codificadores de la lista de dispositivos por formato de salida
+DEVICE_ENCODERS = {"json": json_bytes}
+if MSGPACK_AVAILABLE:
+    DEVICE_ENCODERS["msgpack"] = msgpack.packb
+
+# Mensaje de bienvenida del protocolo TCP (termina con una línea vacía)
+WELCOME_MSG = (
+    b"SERVIDOR DOMOTICO v2.0\n"
+    b"Comandos: LOGIN, LIST, STATUS, SET, AUTO_OFF, "
+    b"BRIGHTNESS, COLOR, CURTAINS, TEMP, LOG, EXIT\n"
+    b"\n"
+)
 
 # Usuarios autorizados (simulación simple)
 USUARIOS = {"admin": "admin123", "user": "pass123"}
@@ -50,6 +158,26 @@ USUARIOS = {"admin": "admin123", "user": "pass123"}
 class Device:
     """Representa un dispositivo domótico (luz o enchufe)"""
 
+    # Atributos fijos: sin __dict__ por instancia y acceso más rápido
+    __slots__ = (
+        "id",
+        "type",
+        "estado",
+        "auto_off",
+        "ultimo_cambio",
+        "auto_off_deadline",
+        "auto_off_gen",
+        "lock",
+        "brightness",
+        "color",
+        "curtains",
+        "temperature",
+        "target_temperature",
+        "_dict_cache",
+        "_proto_cache",
+        "_json_cache",
+    )
+
     def __init__(self, device_id: str, device_type: str, estado: str = "OFF"):
         self.id = device_id
         self.type = device_type  # 'luz', 'enchufe', 'cortinas', 'termostato'
@@ -63,7 +191,11 @@ class Device:
             self.auto_off = 0  # segundos para apagado automático (0 = desactivado)
 
         self.ultimo_cambio = datetime.now().isoformat()
-        self.auto_off_timer = None  # Temporizador activo (solo para luces/enchufes)
+        # Autoapagado pendiente (solo luces/enchufes): instante monotónico o None,
+        # y generación que invalida las entradas ya programadas al cancelar
+        self.auto_off_deadline = None
+        self.auto_off_gen = 0
+        self.lock = threading.Lock()  # Protege el estado de este dispositivo
 
         # Parámetros específicos por tipo de dispositivo
         self.brightness = 40 if device_type == "luz" else 0  # Intensidad de luz (0-100)
@@ -80,8 +212,27 @@ class Device:
             21 if device_type == "termostato" else 0
         )  # Temperatura objetivo
 
+        # Serializaciones cacheadas; DeviceManager las invalida en cada cambio
+        self._dict_cache = None
+        self._proto_cache = None
+        self._json_cache = None
+
+    def invalidate(self):
+        """Descarta las serializaciones cacheadas tras modificar el estado"""
+        self._dict_cache = None
+        self._proto_cache = None
+        self._json_cache = None
+
     def to_dict(self) -> dict:
-        """Serializa el dispositivo a diccionario"""
+        """
+        Serializa el dispositivo a diccionario.
+        El diccionario se cachea hasta el siguiente cambio: es de solo lectura.
+        """
+        if self._dict_cache is None:
+            self._dict_cache = self._build_dict()
+        return self._dict_cache
+
+    def _build_dict(self) -> dict:
         return {
             "id": self.id,
             "type": self.type,
@@ -95,9 +246,38 @@ class Device:
             "target_temperature": self.target_temperature,
         }
 
+    def to_json(self) -> bytes:
+        """Objeto JSON compacto del dispositivo, cacheado como to_dict()"""
+        if self._json_cache is None:
+            self._json_cache = json_bytes(self.to_dict())
+        return self._json_cache
+
     def to_protocol_string(self) -> str:
         """Formato para protocolo de texto: id,estado,auto_off,brightness,color,curtains,temp,target_temp"""
-        return f"{self.id},{self.estado},{self.auto_off},{self.brightness},{self.color},{self.curtains},{self.temperature},{self.target_temperature}"
+        if self._proto_cache is None:
+            self._proto_cache = f"{self.id},{self.estado},{self.auto_off},{self.brightness},{self.color},{self.curtains},{self.temperature},{self.target_temperature}"
+        return self._proto_cache
+
+    def _record_fields(self) -> tuple:
+        """Campos de LIST_RECORD (temperaturas en décimas de grado)"""
+        return (
+            self.id.encode("utf-8"),
+            ESTADO_CODES[self.estado],
+            self.auto_off,
+            self.brightness,
+            bytes.fromhex(self.color[1:]),
+            self.curtains,
+            round(self.temperature * 10),
+            round(self.target_temperature * 10),
+        )
+
+    def to_binary_record(self) -> bytes:
+        """Registro empaquetado de tamaño fijo para LIST BIN (ver LIST_RECORD)"""
+        return LIST_RECORD.pack(*self._record_fields())
+
+    def to_telemetry_record(self) -> bytes:
+        """Registro de la telemetría binaria (ver TELEMETRY_RECORD)"""
+        return TELEMETRY_RECORD.pack(TYPE_CODES[self.type], *self._record_fields())
 
 
 # ==================== GESTOR DE DISPOSITIVOS ====================
@@ -105,13 +285,38 @@ class DeviceManager:
     """
     Núcleo de lógica de negocio del sistema domótico.
     Maneja el estado de todos los dispositivos, autoapagado y registro de eventos.
-    Thread-safe mediante Lock.
+    Thread-safe mediante locks de grano fino: cada Device tiene el suyo, de
+    modo que operar sobre un dispositivo no bloquea a los demás; self.lock
+    solo protege altas en el diccionario de dispositivos y log_lock el
+    historial.
     """
 
     def __init__(self):
         self.devices: Dict[str, Device] = {}
-        self.log: List[str] = []
-        self.lock = threading.Lock()  # Protección contra condiciones de carrera
+        # Entradas (timestamp, device_id, mensaje); se formatean al leerlas
+        self.log: deque = deque(maxlen=LOG_MAX_ENTRIES)  # Descarta las más antiguas
+        self.lock = threading.RLock()  # Altas en self.devices
+        self.log_lock = threading.Lock()  # Historial de eventos
+        # Versión del estado: aumenta con cada cambio de cualquier dispositivo
+        # (next() sobre itertools.count es atómico)
+        self.version = 0
+        self._versions = itertools.count(1)
+        # Lista de dispositivos ya codificada, por formato: (versión, bytes, n)
+        self._encoded: Dict[str, tuple] = {}
+        self._protocol_list = (None, "")  # Respuesta de LIST: (versión, texto)
+
+        # Planificador de autoapagados: un único hilo y un montículo de
+        # (instante, device_id, generación) en lugar de un Timer por orden
+        self._timer_heap: List[tuple] = []
+        self._timer_cv = threading.Condition()
+        threading.Thread(target=self._timer_worker, daemon=True).start()
+
+        # Eco del historial en consola desde un hilo propio: los mutadores
+        # llaman a _add_log con device.lock tomado y no deben esperar a stdout
+        self._console: Optional[queue.SimpleQueue] = None
+        if LOG_TO_CONSOLE:
+            self._console = queue.SimpleQueue()
+            threading.Thread(target=self._console_worker, daemon=True).start()
         self._initialize_devices()
 
     def _initialize_devices(self):
@@ -130,46 +335,108 @@ class DeviceManager:
             self._add_log("SISTEMA", "Dispositivos inicializados")
 
     def _add_log(self, device_id: str, mensaje: str):
-        """Añade entrada al historial (thread-safe)"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[{timestamp}] {device_id}: {mensaje}"
-        self.log.append(log_entry)
-
-        # Limitar a las últimas 100 entradas
-        if len(self.log) > 100:
-            self.log = self.log[-100:]
-
-        print(f"LOG: {log_entry}")  # Debug en consola
+        """Añade entrada al historial (thread-safe, sin formatear ni imprimir)"""
+        entry = (time.time(), device_id, mensaje)
+        with self.log_lock:
+            self.log.append(entry)
+
+        if self._console is not None:
+            self._console.put(entry)
+
+    @staticmethod
+    def _format_log(entry: tuple) -> str:
+        """Texto de una entrada del historial: [fecha hora] device_id: mensaje"""
+        timestamp, device_id, mensaje = entry
+        fecha = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        return f"[{fecha}] {device_id}: {mensaje}"
+
+    def _console_worker(self):
+        """Hilo de eco en consola del historial"""
+        while True:
+            print(f"LOG: {self._format_log(self._console.get())}")  # Debug en consola
+
+    def _changed(self, device: Device):
+        """Invalida las cachés del dispositivo y avanza la versión (con device.lock)"""
+        device.invalidate()
+        self.version = next(self._versions)
+
+    def _snapshot(self) -> List[Device]:
+        """Copia de la lista de dispositivos (no bloquea a los escritores)"""
+        return list(self.devices.values())
 
     def get_all_devices(self) -> List[dict]:
         """Obtiene todos los dispositivos (thread-safe)"""
-        with self.lock:
-            return [dev.to_dict() for dev in self.devices.values()]
+        result = []
+        for dev in self._snapshot():
+            with dev.lock:
+                result.append(dev.to_dict())
+        return result
+
+    def get_devices_encoded(self, fmt: str = "json") -> Tuple[bytes, int]:
+        """
+        Lista de dispositivos serializada (ver DEVICE_ENCODERS) y su tamaño.
+        Se codifica una vez por versión del estado y la comparten la API y
+        la telemetría UDP; mientras nada cambie se devuelven los mismos bytes.
+        """
+        version = self.version
+        cached = self._encoded.get(fmt)
+        if cached is None or cached[0] != version:
+            if fmt == "json":
+                # Se unen los fragmentos por dispositivo: solo se serializan
+                # de nuevo los dispositivos que han cambiado
+                parts = []
+                for dev in self._snapshot():
+                    with dev.lock:
+                        parts.append(dev.to_json())
+                cached = (version, b"[" + b",".join(parts) + b"]", len(parts))
+            elif fmt == "bin":
+                # Registros de tamaño fijo concatenados (ver TELEMETRY_RECORD)
+                parts = []
+                for dev in self._snapshot():
+                    with dev.lock:
+                        parts.append(dev.to_telemetry_record())
+                cached = (version, b"".join(parts), len(parts))
+            else:
+                devices = self.get_all_devices()
+                cached = (version, DEVICE_ENCODERS[fmt](devices), len(devices))
+            self._encoded[fmt] = cached
+        return cached[1], cached[2]
 
     def get_device(self, device_id: str) -> Optional[dict]:
         """Obtiene un dispositivo específico"""
-        with self.lock:
-            device = self.devices.get(device_id)
-            return device.to_dict() if device else None
+        device = self.devices.get(device_id)
+        if not device:
+            return None
+        with device.lock:
+            return device.to_dict()
+
+    def get_device_json(self, device_id: str) -> Optional[bytes]:
+        """Como get_device(), pero ya serializado a JSON (ver Device.to_json)"""
+        device = self.devices.get(device_id)
+        if not device:
+            return None
+        with device.lock:
+            return device.to_json()
 
     def set_device_state(self, device_id: str, nuevo_estado: str) -> bool:
         """
         Cambia el estado de un dispositivo (ON/OFF)
         Retorna True si tiene éxito, False si el dispositivo no existe
         """
-        with self.lock:
-            device = self.devices.get(device_id)
-            if not device:
-                return False
+        device = self.devices.get(device_id)
+        if not device:
+            return False
 
+        with device.lock:
             # Cancelar temporizador previo si existe
-            if device.auto_off_timer:
-                device.auto_off_timer.cancel()
-                device.auto_off_timer = None
+            if device.auto_off_deadline is not None:
+                device.auto_off_gen += 1
+                device.auto_off_deadline = None
                 device.auto_off = 0
 
             device.estado = nuevo_estado
             device.ultimo_cambio = datetime.now().isoformat()
+            self._changed(device)
             self._add_log(device_id, f"Estado cambiado a {nuevo_estado}")
             return True
 
@@ -177,112 +444,247 @@ class DeviceManager:
         """
         Programa el apagado automático de un dispositivo
         """
-        with self.lock:
-            device = self.devices.get(device_id)
-            if not device:
-                return False
+        device = self.devices.get(device_id)
+        if not device:
+            return False
+        if not 0 <= segundos <= MAX_AUTO_OFF:
+            return False  # LIST BIN y la telemetría binaria lo empaquetan en 32 bits
 
-            # Cancelar temporizador anterior si existe
-            if device.auto_off_timer:
-                device.auto_off_timer.cancel()
+        with device.lock:
+            # Cancelar temporizador anterior si existe (su entrada queda obsoleta)
+            device.auto_off_gen += 1
 
             device.auto_off = segundos
+            self._changed(device)
 
             if segundos > 0:
-                # Crear nuevo temporizador
-                device.auto_off_timer = threading.Timer(
-                    segundos, self._auto_off_callback, args=[device_id]
-                )
-                device.auto_off_timer.daemon = True
-                device.auto_off_timer.start()
+                # Programar nuevo temporizador
+                device.auto_off_deadline = time.monotonic() + segundos
+                self._schedule(device.auto_off_deadline, device_id, device.auto_off_gen)
                 self._add_log(device_id, f"Auto-apagado programado en {segundos}s")
             else:
-                device.auto_off_timer = None
+                device.auto_off_deadline = None
                 self._add_log(device_id, "Auto-apagado cancelado")
 
             return True
 
-    def _auto_off_callback(self, device_id: str):
+    def _schedule(self, deadline: float, device_id: str, gen: int):
+        """Añade un autoapagado al montículo y despierta al planificador"""
+        with self._timer_cv:
+            heap = self._timer_heap
+            if len(heap) >= 2 * len(self.devices):
+                # Las entradas canceladas o reprogramadas siguen en el montículo
+                # hasta su vencimiento (que puede estar muy lejos): se purgan
+                # aquí, así queda como mucho una viva por dispositivo
+                heap[:] = [
+                    entry
+                    for entry in heap
+                    if entry[2] == self.devices[entry[1]].auto_off_gen
+                ]
+                heapq.heapify(heap)
+            heapq.heappush(heap, (deadline, device_id, gen))
+            self._timer_cv.notify()
+
+    def _timer_worker(self):
+        """Hilo planificador: espera al siguiente vencimiento y lo ejecuta"""
+        while True:
+            with self._timer_cv:
+                while True:
+                    if not self._timer_heap:
+                        self._timer_cv.wait()
+                        continue
+                    delay = self._timer_heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        _, device_id, gen = heapq.heappop(self._timer_heap)
+                        break
+                    # Acotado: wait() lanza OverflowError por encima de TIMEOUT_MAX
+                    self._timer_cv.wait(min(delay, threading.TIMEOUT_MAX))
+            # Fuera del Condition: el callback toma el lock del dispositivo.
+            # Un fallo no debe matar el único hilo de autoapagados
+            try:
+                self._auto_off_callback(device_id, gen)
+            except Exception as e:
+                logger.error("[TIMER] Error en autoapagado de %s: %s", device_id, e)
+
+    def _auto_off_callback(self, device_id: str, gen: int):
         """
         Callback ejecutado cuando el temporizador de autoapagado expira
         """
-        with self.lock:
-            device = self.devices.get(device_id)
-            if device and device.estado == "ON":
+        device = self.devices.get(device_id)
+        if not device:
+            return
+
+        with device.lock:
+            if gen != device.auto_off_gen:
+                return  # Cancelado o reprogramado después
+            if device.estado == "ON":
                 device.estado = "OFF"
                 device.ultimo_cambio = datetime.now().isoformat()
                 device.auto_off = 0
-                device.auto_off_timer = None
+                device.auto_off_deadline = None
+                self._changed(device)
                 self._add_log(device_id, "Auto-apagado ejecutado")
 
     def set_brightness(self, device_id: str, brightness: int) -> bool:
         """Establece el brillo de una luz (0-100)"""
-        with self.lock:
-            device = self.devices.get(device_id)
-            if not device or device.type != "luz":
-                return False
+        device = self.devices.get(device_id)
+        if not device or device.type != "luz":
+            return False
+
+        with device.lock:
             device.brightness = max(0, min(100, brightness))
             device.ultimo_cambio = datetime.now().isoformat()
+            self._changed(device)
             self._add_log(device_id, f"Brillo cambiado a {device.brightness}%")
             return True
 
+    def set_brightness_and_on(self, device_id: str, brightness: int) -> bool:
+        """
+        Ajusta el brillo de una luz y la enciende en una sola operación
+        (equivale a set_brightness + set_device_state ON, con un solo lock y
+        una sola entrada en el historial)
+        """
+        device = self.devices.get(device_id)
+        if not device or device.type != "luz":
+            return False
+
+        with device.lock:
+            # Como set_device_state: cancela el autoapagado pendiente
+            if device.auto_off_deadline is not None:
+                device.auto_off_gen += 1
+                device.auto_off_deadline = None
+                device.auto_off = 0
+
+            device.brightness = max(0, min(100, brightness))
+            device.estado = "ON"
+            device.ultimo_cambio = datetime.now().isoformat()
+            self._changed(device)
+            self._add_log(
+                device_id, f"Brillo cambiado a {device.brightness}% y encendida"
+            )
+            return True
+
     def set_color(self, device_id: str, color: str) -> bool:
         """Establece el color de una luz (formato hex #RRGGBB)"""
-        with self.lock:
-            device = self.devices.get(device_id)
-            if not device or device.type != "luz":
-                return False
+        device = self.devices.get(device_id)
+        if not device or device.type != "luz":
+            return False
+        if not isinstance(color, str) or not COLOR_RE.fullmatch(color):
+            return False  # LIST BIN y el simulador esperan #RRGGBB
+
+        with device.lock:
             device.color = color
             device.ultimo_cambio = datetime.now().isoformat()
+            self._changed(device)
             self._add_log(device_id, f"Color cambiado a {color}")
             return True
 
     def set_curtains(self, curtains: int) -> bool:
         """Establece la posición de las cortinas (0-100)"""
-        with self.lock:
-            device = self.devices.get("cortinas")
-            if not device:
-                return False
+        device = self.devices.get("cortinas")
+        if not device:
+            return False
+
+        with device.lock:
             curtains = max(0, min(100, curtains))
             device.curtains = curtains
             device.ultimo_cambio = datetime.now().isoformat()
+            self._changed(device)
             self._add_log("cortinas", f"Posición ajustada a {curtains}%")
             return True
 
     def set_temperature(self, target_temp: float) -> bool:
         """Establece la temperatura objetivo"""
-        with self.lock:
-            device = self.devices.get("termostato")
-            if not device:
-                return False
+        device = self.devices.get("termostato")
+        if not device:
+            return False
+
+        with device.lock:
             target_temp = max(16, min(30, target_temp))
             device.target_temperature = target_temp
             device.ultimo_cambio = datetime.now().isoformat()
+            self._changed(device)
             self._add_log("termostato", f"Temperatura objetivo: {target_temp}°C")
             return True
 
     def get_log(self, limit: int = 20) -> List[str]:
         """Obtiene el historial de eventos"""
-        with self.lock:
-            return self.log[-limit:]
+        with self.log_lock:
+            if limit > 0:
+                # Solo las últimas `limit` entradas, sin copiar el historial entero
+                start = max(0, len(self.log) - limit)
+                entries = list(itertools.islice(self.log, start, None))
+            else:
+                entries = list(self.log)[-limit:]
+        # Formateo fuera del lock: no retrasa a los mutadores
+        return [self._format_log(entry) for entry in entries]
 
     def get_protocol_list(self) -> str:
         """
         Retorna lista de dispositivos en formato protocolo texto:
         OK <cantidad> id1,estado1,auto_off1;id2,estado2,auto_off2;...
         """
-        with self.lock:
-            devices_str = ";".join(
-                [dev.to_protocol_string() for dev in self.devices.values()]
-            )
-            return f"OK {len(self.devices)} {devices_str}"
+        version = self.version
+        cached_version, response = self._protocol_list
+        if cached_version != version:
+            devices = self._snapshot()
+            parts = []
+            for dev in devices:
+                with dev.lock:
+                    parts.append(dev.to_protocol_string())
+            response = f"OK {len(devices)} {';'.join(parts)}"
+            self._protocol_list = (version, response)
+        return response
+
+    def get_binary_list(self) -> bytes:
+        """
+        Retorna la lista de dispositivos para LIST BIN (solo modo FRAMED):
+        b"OK BIN " seguido de un registro LIST_RECORD por dispositivo.
+        """
+        records = [b"OK BIN "]
+        for dev in self._snapshot():
+            with dev.lock:
+                records.append(dev.to_binary_record())
+        return b"".join(records)
+
+
+# ==================== BUCLE DE EVENTOS ====================
+class EventLoopThread:
+    """
+    Bucle asyncio en un hilo daemon, compartido por el servidor TCP y el
+    broadcaster UDP: todas las conexiones se atienden en un único hilo.
+    """
+
+    def __init__(self):
+        # uvloop (libuv) si está instalado; si no, el bucle estándar de asyncio
+        self.loop = (
+            uvloop.new_event_loop() if UVLOOP_AVAILABLE else asyncio.new_event_loop()
+        )
+
+    def start(self):
+        """Arranca el bucle en su hilo"""
+        thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        thread.start()
+
+    def run(self, coro):
+        """Ejecuta una corrutina en el bucle y espera su resultado"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def call(self, callback, *args):
+        """Programa una llamada en el hilo del bucle (thread-safe)"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self):
+        """Detiene el bucle"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
 
 
 # ==================== SERVIDOR TCP ====================
 class TCPServer:
     """
     Servidor TCP para comandos de control directo.
-    Soporta múltiples clientes concurrentes mediante threading.
+    Soporta múltiples clientes concurrentes con asyncio (una corrutina por
+    cliente en el bucle compartido, sin hilo por conexión).
     """
 
     def __init__(self, device_manager: DeviceManager, host: str, port: int):
@@ -290,83 +692,164 @@ class TCPServer:
         self.host = host
         self.port = port
         self.running = False
-        self.server_socket = None
+        self.server = None  # asyncio.Server
+        self.io_loop = None
+
+        # Tablas de despacho: comando (en mayúsculas) -> handler(parts)
+        self._public_commands = {
+            "LOGIN": self._cmd_login,
+            "EXIT": self._cmd_exit,
+            "LIST": self._cmd_list,
+            "STATUS": self._cmd_status,
+            "LOG": self._cmd_log,
+        }
+        self._auth_commands = {
+            "SET": self._cmd_set,
+            "AUTO_OFF": self._cmd_auto_off,
+            "BRIGHTNESS": self._cmd_brightness,
+            "COLOR": self._cmd_color,
+            "CURTAINS": self._cmd_curtains,
+            "TEMP": self._cmd_temp,
+        }
+        # SET <id> <subcomando> ... -> handler(device_id, subcommand, parts)
+        self._set_subcommands = {
+            "ON": self._set_onoff,
+            "OFF": self._set_onoff,
+            "BRIGHTNESS": self._set_brightness,
+            "COLOR": self._set_color,
+        }
+        # SET sobre dispositivos con sintaxis propia (id en minúsculas, con los
+        # alias persianas/clima por compatibilidad) -> handler(subcommand, parts)
+        self._set_devices = {
+            "cortinas": self._set_curtains_level,
+            "persianas": self._set_curtains_level,
+            "termostato": self._set_thermostat_temp,
+            "clima": self._set_thermostat_temp,
+        }
 
-    def start(self):
-        """Inicia el servidor TCP en un hilo separado"""
+    def start(self, io_loop: EventLoopThread):
+        """Inicia el servidor TCP en el bucle de eventos compartido"""
         self.running = True
-        thread = threading.Thread(target=self._run, daemon=True)
-        thread.start()
+        self.io_loop = io_loop
+        self.server = io_loop.run(
+            asyncio.start_server(
+                self._handle_client,
+                self.host,
+                self.port,
+                reuse_address=True,
+                backlog=socket.SOMAXCONN,  # Ráfagas de reconexión de paneles
+                limit=TCP_MAX_LINE,  # Buffer de lectura acotado por cliente
+            )
+        )
         print(f"[TCP] Servidor iniciado en {self.host}:{self.port}")
-
-    def _run(self):
-        """Loop principal del servidor TCP"""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
-
         print(f"[TCP] Esperando conexiones en puerto {self.port}...")
 
-        while self.running:
-            try:
-                client_socket, address = self.server_socket.accept()
-                print(f"[TCP] Cliente conectado desde {address}")
-
-                # Crear hilo para manejar cliente
-                client_thread = threading.Thread(
-                    target=self._handle_client,
-                    args=(client_socket, address),
-                    daemon=True,
-                )
-                client_thread.start()
-
-            except Exception as e:
-                if self.running:
-                    print(f"[TCP] Error aceptando conexión: {e}")
-
-    def _handle_client(self, client_socket: socket.socket, address):
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
         """Maneja la comunicación con un cliente específico"""
+        address = writer.get_extra_info("peername")
+        logger.info("[TCP] Cliente conectado desde %s", address)
+        # Respuestas cortas: enviarlas sin esperar al algoritmo de Nagle
+        writer.get_extra_info("socket").setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
         authenticated = False
         username = None
+        framed = False  # Tras FRAMED: respuestas con prefijo de longitud de 4 bytes
 
         try:
             # Enviar mensaje de bienvenida
-            welcome_msg = (
-                b"SERVIDOR DOMOTICO v2.0\n"
-                b"Comandos: LOGIN, LIST, STATUS, SET, AUTO_OFF, "
-                b"BRIGHTNESS, COLOR, CURTAINS, TEMP, LOG, EXIT\n"
-            )
-            client_socket.send(welcome_msg)
+            writer.write(WELCOME_MSG)
+            await writer.drain()
 
             while True:
-                # Recibir comando
-                data = client_socket.recv(1024).decode("utf-8").strip()
+                # Un comando por línea; los comandos encadenados en un mismo
+                # segmento (pipelining) se atienden en orden
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError:
+                    break  # Cliente desconectado (se descarta una línea a medias)
+                except asyncio.LimitOverrunError as e:
+                    # Línea mayor que TCP_MAX_LINE: se descarta hasta el salto
+                    # de línea y se responde con error, sin cortar la conexión
+                    if not await self._discard_line(reader, e.consumed):
+                        break
+                    logger.info("[TCP] Comando demasiado largo de %s", address)
+                    self._write_response(writer, LINE_TOO_LONG_MSG, framed)
+                    await writer.drain()
+                    continue
+
+                data = line.decode("utf-8", "replace").strip()
                 if not data:
-                    break
-
-                print(f"[TCP] Comando recibido de {address}: {data}")
-
-                # Procesar comando
-                response = self._process_command(data, authenticated, username)
+                    continue
 
-                # Actualizar autenticación si LOGIN fue exitoso
-                if response.startswith("OK LOGIN"):
-                    authenticated = True
-                    username = data.split()[1] if len(data.split()) > 1 else "unknown"
+                logger.info("[TCP] Comando recibido de %s: %s", address, data)
 
-                # Enviar respuesta
-                client_socket.send((response + "\n").encode("utf-8"))
+                if framed and data.upper().split() == ["LIST", "BIN"]:
+                    # Listado binario: el prefijo de longitud delimita los registros
+                    response = ""
+                    payload = self.device_manager.get_binary_list()
+                else:
+                    # Procesar comando (FRAMED cambia el formato de las respuestas)
+                    if data.upper() == "FRAMED":
+                        response = "OK FRAMED"
+                    else:
+                        response = self._process_command(data, authenticated, username)
+
+                    # Actualizar autenticación si LOGIN fue exitoso
+                    if response.startswith("OK LOGIN"):
+                        authenticated = True
+                        username = (
+                            data.split()[1] if len(data.split()) > 1 else "unknown"
+                        )
+
+                    payload = response.encode("utf-8")
+
+                self._write_response(writer, payload, framed)
+                await writer.drain()
+                # La confirmación de FRAMED aún viaja en texto; el resto, en tramas
+                if response == "OK FRAMED":
+                    framed = True
 
                 # Salir si el cliente envía EXIT
                 if data.upper() == "EXIT":
                     break
 
         except Exception as e:
-            print(f"[TCP] Error con cliente {address}: {e}")
+            logger.error("[TCP] Error con cliente %s: %s", address, e)
         finally:
-            client_socket.close()
-            print(f"[TCP] Cliente {address} desconectado")
+            writer.close()
+            logger.info("[TCP] Cliente %s desconectado", address)
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, payload: bytes, framed: bool):
+        """
+        Envía una respuesta: línea de texto o trama ">I" + cuerpo. El
+        transporte encola ambos trozos sin concatenarlos ni cortarlos
+        """
+        if framed:
+            writer.writelines((FRAME_HEADER.pack(len(payload)), payload))
+        else:
+            writer.writelines((payload, b"\n"))
+
+    @staticmethod
+    async def _discard_line(reader: asyncio.StreamReader, consumed: int) -> bool:
+        """
+        Descarta el resto de una línea demasiado larga, hasta su salto de
+        línea incluido, sin acumularla en memoria. Retorna False si el
+        cliente se desconecta antes.
+        """
+        try:
+            while True:
+                await reader.readexactly(consumed)
+                try:
+                    await reader.readuntil(b"\n")
+                    return True
+                except asyncio.LimitOverrunError as e:
+                    consumed = e.consumed
+        except asyncio.IncompleteReadError:
+            return False
 
     def _process_command(self, command: str, authenticated: bool, username: str) -> str:
         """
@@ -379,208 +862,222 @@ class TCPServer:
 
         cmd = parts[0].upper()
 
-        # LOGIN <user> <pass>
-        if cmd == "LOGIN":
-            if len(parts) != 3:
-                return "ERROR LOGIN: Uso: LOGIN <usuario> <contraseña>"
-            user, password = parts[1], parts[2]
-            if user in USUARIOS and USUARIOS[user] == password:
-                return f"OK LOGIN Bienvenido {user}"
-            return "ERROR LOGIN: Credenciales inválidas"
-
-        # EXIT
-        if cmd == "EXIT":
-            return "OK Hasta pronto"
-
         # Comandos que NO requieren autenticación
-        # LIST
-        if cmd == "LIST":
-            return self.device_manager.get_protocol_list()
-
-        # STATUS <id>
-        if cmd == "STATUS":
-            if len(parts) != 2:
-                return "ERROR STATUS: Uso: STATUS <device_id>"
-            device_id = parts[1]
-            device = self.device_manager.get_device(device_id)
-            if device:
-                return f"OK {device['id']} {device['estado']} {device['auto_off']}"
-            return f"ERROR Dispositivo '{device_id}' no encontrado"
-
-        # LOG
-        if cmd == "LOG":
-            logs = self.device_manager.get_log(20)
-            return "OK LOG\n" + "\n".join(logs)
+        handler = self._public_commands.get(cmd)
+        if handler:
+            return handler(parts)
 
         # Comandos que SÍ requieren autenticación
         if not authenticated:
             return f"ERROR {cmd}: Requiere autenticación (usar LOGIN primero)"
 
-        # SET <id> <ON|OFF> o SET <id> <BRIGHTNESS|COLOR> <value> o SET cortinas LEVEL <value> o SET termostato TEMP <value>
-        if cmd == "SET":
-            if len(parts) < 3:
-                return "ERROR SET: Uso: SET <device_id> <ON|OFF|BRIGHTNESS|COLOR> [value] o SET cortinas LEVEL <0-100> o SET termostato TEMP <16-30>"
-
-            device_id = parts[1]
-            subcommand = parts[2].upper()
-
-            # SET cortinas LEVEL <0-100> (también acepta persianas por compatibilidad)
-            if device_id.lower() in ["persianas", "cortinas"]:
-                if subcommand == "LEVEL" and len(parts) == 4:
-                    try:
-                        level = int(parts[3])
-                        if level < 0 or level > 100:
-                            return "ERROR SET: El nivel de cortinas debe estar entre 0 y 100"
-                        device = self.device_manager.devices.get("cortinas")
-                        if device:
-                            device.curtains = level
-                            device.ultimo_cambio = datetime.now().isoformat()
-                            self.device_manager._add_log(
-                                "cortinas", f"Posición ajustada a {level}%"
-                            )
-                            return f"OK SET cortinas LEVEL {level}"
-                        return "ERROR Dispositivo cortinas no encontrado"
-                    except ValueError:
-                        return "ERROR SET: El nivel debe ser un número entero"
-                return "ERROR SET: Uso: SET cortinas LEVEL <0-100>"
-
-            # SET termostato TEMP <16-30> (también acepta clima por compatibilidad)
-            if device_id.lower() in ["clima", "termostato"]:
-                if subcommand == "TEMP" and len(parts) == 4:
-                    try:
-                        temp = float(parts[3])
-                        if temp < 16 or temp > 30:
-                            return (
-                                "ERROR SET: La temperatura debe estar entre 16 y 30°C"
-                            )
-                        device = self.device_manager.devices.get("termostato")
-                        if device:
-                            device.target_temperature = temp
-                            device.ultimo_cambio = datetime.now().isoformat()
-                            self.device_manager._add_log(
-                                "termostato", f"Temperatura objetivo: {temp}°C"
-                            )
-                            return f"OK SET termostato TEMP {temp}"
-                        return "ERROR Dispositivo termostato no encontrado"
-                    except ValueError:
-                        return "ERROR SET: La temperatura debe ser un número"
-                return "ERROR SET: Uso: SET termostato TEMP <16-30>"
-
-            # SET <device_id> ON|OFF
-            if subcommand in ["ON", "OFF"]:
-                if self.device_manager.set_device_state(device_id, subcommand):
-                    return f"OK SET {device_id} {subcommand}"
-                return f"ERROR Dispositivo '{device_id}' no encontrado"
-
-            # SET <device_id> BRIGHTNESS <0-100>
-            if subcommand == "BRIGHTNESS":
-                if len(parts) != 4:
-                    return "ERROR SET: Uso: SET <device_id> BRIGHTNESS <0-100>"
-                try:
-                    brightness = int(parts[3])
-                    if brightness < 0 or brightness > 100:
-                        return "ERROR SET: El brillo debe estar entre 0 y 100"
-                    if self.device_manager.set_brightness(device_id, brightness):
-                        # Auto-encender si el brillo es > 0
-                        if brightness > 0:
-                            self.device_manager.set_device_state(device_id, "ON")
-                        return f"OK SET {device_id} BRIGHTNESS {brightness}"
-                    return (
-                        f"ERROR Dispositivo '{device_id}' no encontrado o no es una luz"
-                    )
-                except ValueError:
-                    return "ERROR SET: El brillo debe ser un número entero"
-
-            # SET <device_id> COLOR <#RRGGBB>
-            if subcommand == "COLOR":
-                if len(parts) != 4:
-                    return "ERROR SET: Uso: SET <device_id> COLOR <#RRGGBB>"
-                color = parts[3]
-                if not color.startswith("#") or len(color) != 7:
-                    return "ERROR SET: El color debe estar en formato #RRGGBB"
-                if self.device_manager.set_color(device_id, color):
-                    return f"OK SET {device_id} COLOR {color}"
-                return f"ERROR Dispositivo '{device_id}' no encontrado o no es una luz"
-
-            return f"ERROR SET: Subcomando '{subcommand}' no reconocido. Use: ON, OFF, BRIGHTNESS, COLOR, LEVEL (persianas), TEMP (clima)"
-
-        # AUTO_OFF <id> <segundos>
-        if cmd == "AUTO_OFF":
-            if len(parts) != 3:
-                return "ERROR AUTO_OFF: Uso: AUTO_OFF <device_id> <segundos>"
-            device_id = parts[1]
-            try:
-                segundos = int(parts[2])
-                if segundos < 0:
-                    return "ERROR AUTO_OFF: Los segundos deben ser >= 0"
-                if self.device_manager.set_auto_off(device_id, segundos):
-                    return f"OK AUTO_OFF {device_id} {segundos}s"
-                return f"ERROR Dispositivo '{device_id}' no encontrado"
-            except ValueError:
-                return "ERROR AUTO_OFF: Los segundos deben ser un número entero"
+        handler = self._auth_commands.get(cmd)
+        if handler:
+            return handler(parts)
 
-        # BRIGHTNESS <id> <0-100>
-        if cmd == "BRIGHTNESS":
-            if len(parts) != 3:
-                return "ERROR BRIGHTNESS: Uso: BRIGHTNESS <device_id> <0-100>"
-            device_id = parts[1]
-            try:
-                brightness = int(parts[2])
-                if brightness < 0 or brightness > 100:
-                    return "ERROR BRIGHTNESS: El valor debe estar entre 0 y 100"
-                if self.device_manager.set_brightness(device_id, brightness):
-                    return f"OK BRIGHTNESS {device_id} {brightness}"
-                return f"ERROR Dispositivo '{device_id}' no encontrado o no es una luz"
-            except ValueError:
-                return "ERROR BRIGHTNESS: El valor debe ser un número entero"
-
-        # COLOR <id> <#RRGGBB>
-        if cmd == "COLOR":
-            if len(parts) != 3:
-                return "ERROR COLOR: Uso: COLOR <device_id> <#RRGGBB>"
-            device_id = parts[1]
-            color = parts[2]
-            if not color.startswith("#") or len(color) != 7:
-                return "ERROR COLOR: El color debe estar en formato #RRGGBB"
-            if self.device_manager.set_color(device_id, color):
-                return f"OK COLOR {device_id} {color}"
-            return f"ERROR Dispositivo '{device_id}' no encontrado o no es una luz"
+        return f"ERROR Comando '{cmd}' no reconocido"
+
+    # ---------- Comandos públicos ----------
+
+    def _cmd_login(self, parts: List[str]) -> str:
+        """LOGIN <user> <pass>"""
+        if len(parts) != 3:
+            return "ERROR LOGIN: Uso: LOGIN <usuario> <contraseña>"
+        user, password = parts[1], parts[2]
+        if user in USUARIOS and USUARIOS[user] == password:
+            return f"OK LOGIN Bienvenido {user}"
+        return "ERROR LOGIN: Credenciales inválidas"
+
+    def _cmd_exit(self, parts: List[str]) -> str:
+        """EXIT"""
+        return "OK Hasta pronto"
+
+    def _cmd_list(self, parts: List[str]) -> str:
+        """LIST (LIST BIN solo en modo FRAMED, ver _handle_client)"""
+        if len(parts) > 1 and parts[1].upper() == "BIN":
+            return "ERROR LIST BIN: Requiere modo FRAMED"
+        return self.device_manager.get_protocol_list()
+
+    def _cmd_status(self, parts: List[str]) -> str:
+        """STATUS <id>"""
+        if len(parts) != 2:
+            return "ERROR STATUS: Uso: STATUS <device_id>"
+        device_id = parts[1]
+        device = self.device_manager.get_device(device_id)
+        if device:
+            return f"OK {device['id']} {device['estado']} {device['auto_off']}"
+        return f"ERROR Dispositivo '{device_id}' no encontrado"
+
+    def _cmd_log(self, parts: List[str]) -> str:
+        """LOG -> "OK LOG <n>" seguido de n líneas"""
+        logs = self.device_manager.get_log(20)
+        return "\n".join([f"OK LOG {len(logs)}", *logs])
+
+    # ---------- Comandos con autenticación ----------
+
+    def _cmd_set(self, parts: List[str]) -> str:
+        """
+        SET <id> <ON|OFF> o SET <id> <BRIGHTNESS|COLOR> <value>
+        o SET cortinas LEVEL <value> o SET termostato TEMP <value>
+        """
+        if len(parts) < 3:
+            return "ERROR SET: Uso: SET <device_id> <ON|OFF|BRIGHTNESS|COLOR> [value] o SET cortinas LEVEL <0-100> o SET termostato TEMP <16-30>"
+
+        device_id = parts[1]
+        subcommand = parts[2].upper()
+
+        # SET cortinas LEVEL <0-100> / SET termostato TEMP <16-30>
+        device_handler = self._set_devices.get(device_id.lower())
+        if device_handler:
+            return device_handler(subcommand, parts)
+
+        handler = self._set_subcommands.get(subcommand)
+        if handler:
+            return handler(device_id, subcommand, parts)
 
-        # CURTAINS <0-100>
-        if cmd == "CURTAINS":
-            if len(parts) != 2:
-                return "ERROR CURTAINS: Uso: CURTAINS <0-100>"
+        return f"ERROR SET: Subcomando '{subcommand}' no reconocido. Use: ON, OFF, BRIGHTNESS, COLOR, LEVEL (persianas), TEMP (clima)"
+
+    def _set_curtains_level(self, subcommand: str, parts: List[str]) -> str:
+        """SET cortinas LEVEL <0-100>"""
+        if subcommand == "LEVEL" and len(parts) == 4:
             try:
-                curtains = int(parts[1])
-                if curtains < 0 or curtains > 100:
-                    return "ERROR CURTAINS: El valor debe estar entre 0 y 100"
-                if self.device_manager.set_curtains(curtains):
-                    return f"OK CURTAINS {curtains}"
-                return "ERROR No se pudo ajustar las cortinas"
+                level = int(parts[3])
+                if level < 0 or level > 100:
+                    return "ERROR SET: El nivel de cortinas debe estar entre 0 y 100"
+                if self.device_manager.set_curtains(level):
+                    return f"OK SET cortinas LEVEL {level}"
+                return "ERROR Dispositivo cortinas no encontrado"
             except ValueError:
-                return "ERROR CURTAINS: El valor debe ser un número entero"
+                return "ERROR SET: El nivel debe ser un número entero"
+        return "ERROR SET: Uso: SET cortinas LEVEL <0-100>"
 
-        # TEMP <temperatura>
-        if cmd == "TEMP":
-            if len(parts) != 2:
-                return "ERROR TEMP: Uso: TEMP <16-30>"
+    def _set_thermostat_temp(self, subcommand: str, parts: List[str]) -> str:
+        """SET termostato TEMP <16-30>"""
+        if subcommand == "TEMP" and len(parts) == 4:
             try:
-                temp = float(parts[1])
+                temp = float(parts[3])
                 if temp < 16 or temp > 30:
-                    return "ERROR TEMP: La temperatura debe estar entre 16 y 30°C"
+                    return "ERROR SET: La temperatura debe estar entre 16 y 30°C"
                 if self.device_manager.set_temperature(temp):
-                    return f"OK TEMP {temp}"
-                return "ERROR No se pudo ajustar la temperatura"
+                    return f"OK SET termostato TEMP {temp}"
+                return "ERROR Dispositivo termostato no encontrado"
             except ValueError:
-                return "ERROR TEMP: La temperatura debe ser un número"
+                return "ERROR SET: La temperatura debe ser un número"
+        return "ERROR SET: Uso: SET termostato TEMP <16-30>"
+
+    def _set_onoff(self, device_id: str, subcommand: str, parts: List[str]) -> str:
+        """SET <device_id> ON|OFF"""
+        if self.device_manager.set_device_state(device_id, subcommand):
+            return f"OK SET {device_id} {subcommand}"
+        return f"ERROR Dispositivo '{device_id}' no encontrado"
+
+    def _set_brightness(self, device_id: str, subcommand: str, parts: List[str]) -> str:
+        """SET <device_id> BRIGHTNESS <0-100>"""
+        if len(parts) != 4:
+            return "ERROR SET: Uso: SET <device_id> BRIGHTNESS <0-100>"
+        try:
+            brightness = int(parts[3])
+            if brightness < 0 or brightness > 100:
+                return "ERROR SET: El brillo debe estar entre 0 y 100"
+            # Auto-encender si el brillo es > 0
+            if brightness > 0:
+                ok = self.device_manager.set_brightness_and_on(device_id, brightness)
+            else:
+                ok = self.device_manager.set_brightness(device_id, brightness)
+            if ok:
+                return f"OK SET {device_id} BRIGHTNESS {brightness}"
+            return f"ERROR Dispositivo '{device_id}' no encontrado o no es una luz"
+        except ValueError:
+            return "ERROR SET: El brillo debe ser un número entero"
+
+    def _set_color(self, device_id: str, subcommand: str, parts: List[str]) -> str:
+        """SET <device_id> COLOR <#RRGGBB>"""
+        if len(parts) != 4:
+            return "ERROR SET: Uso: SET <device_id> COLOR <#RRGGBB>"
+        color = parts[3]
+        if not COLOR_RE.fullmatch(color):
+            return "ERROR SET: El color debe estar en formato #RRGGBB"
+        if self.device_manager.set_color(device_id, color):
+            return f"OK SET {device_id} COLOR {color}"
+        return f"ERROR Dispositivo '{device_id}' no encontrado o no es una luz"
+
+    def _cmd_auto_off(self, parts: List[str]) -> str:
+        """AUTO_OFF <id> <segundos>"""
+        if len(parts) != 3:
+            return "ERROR AUTO_OFF: Uso: AUTO_OFF <device_id> <segundos>"
+        device_id = parts[1]
+        try:
+            segundos = int(parts[2])
+            if not 0 <= segundos <= MAX_AUTO_OFF:
+                return (
+                    f"ERROR AUTO_OFF: Los segundos deben estar entre 0 y {MAX_AUTO_OFF}"
+                )
+            if self.device_manager.set_auto_off(device_id, segundos):
+                return f"OK AUTO_OFF {device_id} {segundos}s"
+            return f"ERROR Dispositivo '{device_id}' no encontrado"
+        except ValueError:
+            return "ERROR AUTO_OFF: Los segundos deben ser un número entero"
 
-        return f"ERROR Comando '{cmd}' no reconocido"
+    def _cmd_brightness(self, parts: List[str]) -> str:
+        """BRIGHTNESS <id> <0-100>"""
+        if len(parts) != 3:
+            return "ERROR BRIGHTNESS: Uso: BRIGHTNESS <device_id> <0-100>"
+        device_id = parts[1]
+        try:
+            brightness = int(parts[2])
+            if brightness < 0 or brightness > 100:
+                return "ERROR BRIGHTNESS: El valor debe estar entre 0 y 100"
+            if self.device_manager.set_brightness(device_id, brightness):
+                return f"OK BRIGHTNESS {device_id} {brightness}"
+            return f"ERROR Dispositivo '{device_id}' no encontrado o no es una luz"
+        except ValueError:
+            return "ERROR BRIGHTNESS: El valor debe ser un número entero"
+
+    def _cmd_color(self, parts: List[str]) -> str:
+        """COLOR <id> <#RRGGBB>"""
+        if len(parts) != 3:
+            return "ERROR COLOR: Uso: COLOR <device_id> <#RRGGBB>"
+        device_id = parts[1]
+        color = parts[2]
+        if not COLOR_RE.fullmatch(color):
+            return "ERROR COLOR: El color debe estar en formato #RRGGBB"
+        if self.device_manager.set_color(device_id, color):
+            return f"OK COLOR {device_id} {color}"
+        return f"ERROR Dispositivo '{device_id}' no encontrado o no es una luz"
+
+    def _cmd_curtains(self, parts: List[str]) -> str:
+        """CURTAINS <0-100>"""
+        if len(parts) != 2:
+            return "ERROR CURTAINS: Uso: CURTAINS <0-100>"
+        try:
+            curtains = int(parts[1])
+            if curtains < 0 or curtains > 100:
+                return "ERROR CURTAINS: El valor debe estar entre 0 y 100"
+            if self.device_manager.set_curtains(curtains):
+                return f"OK CURTAINS {curtains}"
+            return "ERROR No se pudo ajustar las cortinas"
+        except ValueError:
+            return "ERROR CURTAINS: El valor debe ser un número entero"
+
+    def _cmd_temp(self, parts: List[str]) -> str:
+        """TEMP <temperatura>"""
+        if len(parts) != 2:
+            return "ERROR TEMP: Uso: TEMP <16-30>"
+        try:
+            temp = float(parts[1])
+            if temp < 16 or temp > 30:
+                return "ERROR TEMP: La temperatura debe estar entre 16 y 30°C"
+            if self.device_manager.set_temperature(temp):
+                return f"OK TEMP {temp}"
+            return "ERROR No se pudo ajustar la temperatura"
+        except ValueError:
+            return "ERROR TEMP: La temperatura debe ser un número"
 
     def stop(self):
         """Detiene el servidor TCP"""
         self.running = False
-        if self.server_socket:
-            self.server_socket.close()
+        if self.server:
+            self.io_loop.call(self.server.close)
 
 
 # ==================== SERVIDOR UDP (BROADCAST) ====================
@@ -590,79 +1087,330 @@ class UDPBroadcaster:
     Útil para monitorización pasiva y telemetría.
     """
 
-    def __init__(self, device_manager: DeviceManager, port: int, interval: int):
+    def __init__(
+        self,
+        device_manager: DeviceManager,
+        port: int,
+        interval: int,
+        fmt: str = "json",
+    ):
         self.device_manager = device_manager
         self.port = port
         self.interval = interval
         self.running = False
+        self.io_loop = None
+        self._transport = None  # asyncio.DatagramTransport
+        self._next_broadcast = None  # asyncio.TimerHandle del próximo envío
+
+        if fmt not in TELEMETRY_FORMATS:
+            print(f"⚠️ TELEMETRY_FORMAT '{fmt}' desconocido. Telemetría UDP en JSON.")
+            fmt = "json"
+        elif fmt == "msgpack" and not MSGPACK_AVAILABLE:
+            print("⚠️ msgpack no instalado. Telemetría UDP en JSON.")
+            fmt = "json"
+        self.format = fmt
+
+        # El mensaje es {"timestamp": ..., "devices": [...]}: la lista de
+        # dispositivos llega ya codificada de DeviceManager.get_devices_encoded
+        # y cada envío solo añade el timestamp alrededor de esos bytes. En
+        # binario el timestamp va en TELEMETRY_HEADER (ver _build_payload)
+        self._dumps = DEVICE_ENCODERS.get(fmt)
+        if fmt == "bin":
+            self._prefix = self._separator = self._suffix = b""
+        elif fmt == "msgpack":
+            self._prefix = b"\x82" + msgpack.packb("timestamp")  # mapa de 2
+            self._separator = msgpack.packb("devices")
+            self._suffix = b""
+        else:
+            self._prefix = b'{"timestamp":'
+            self._separator = b',"devices":'
+            self._suffix = b"}"
+        self._devices_count = 0
 
-    def start(self):
-        """Inicia el broadcaster en un hilo separado"""
+    def start(self, io_loop: EventLoopThread):
+        """Inicia el broadcaster en el bucle de eventos compartido"""
         self.running = True
-        thread = threading.Thread(target=self._run, daemon=True)
-        thread.start()
+        self.io_loop = io_loop
+        io_loop.run(self._open())
         print(
             f"[UDP] Broadcaster iniciado en puerto {self.port} (cada {self.interval}s)"
         )
 
-    def _run(self):
-        """Loop de broadcast periódico"""
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    async def _open(self):
+        """Crea el socket UDP de broadcast y programa el primer envío"""
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, family=socket.AF_INET, allow_broadcast=True
+        )
+        self._next_broadcast = loop.call_soon(self._broadcast)
 
-        while self.running:
-            try:
-                # Obtener estado actual
-                devices = self.device_manager.get_all_devices()
-                payload = json.dumps(
-                    {"timestamp": datetime.now().isoformat(), "devices": devices}
-                )
+    def _build_payload(self) -> bytes:
+        """Mensaje de telemetría; reutiliza la lista serializada si no cambió"""
+        devices_payload, self._devices_count = self.device_manager.get_devices_encoded(
+            self.format
+        )
+        if self.format == "bin":
+            header = TELEMETRY_HEADER.pack(
+                TELEMETRY_MAGIC, time.time(), self._devices_count
+            )
+            return header + devices_payload
+        timestamp = self._dumps(datetime.now().isoformat())
+        return b"".join(
+            (self._prefix, timestamp, self._separator, devices_payload, self._suffix)
+        )
 
-                # Broadcast
-                sock.sendto(payload.encode("utf-8"), ("<broadcast>", self.port))
-                print(f"[UDP] Broadcast enviado ({len(devices)} dispositivos)")
+    def _broadcast(self):
+        """Envía un broadcast y programa el siguiente (en el hilo del bucle)"""
+        if not self.running:
+            return
+        try:
+            # Obtener estado actual
+            payload = self._build_payload()
 
-            except Exception as e:
-                print(f"[UDP] Error en broadcast: {e}")
+            # Broadcast
+            self._transport.sendto(payload, (UDP_BROADCAST_ADDR, self.port))
+            logger.info(
+                "[UDP] Broadcast enviado (%d dispositivos)", self._devices_count
+            )
 
-            time.sleep(self.interval)
+        except Exception as e:
+            logger.error("[UDP] Error en broadcast: %s", e)
+
+        self._next_broadcast = self.io_loop.loop.call_later(
+            self.interval, self._broadcast
+        )
 
-        sock.close()
+    def _close(self):
+        """Cancela el próximo envío y cierra el socket (en el hilo del bucle)"""
+        if self._next_broadcast:
+            self._next_broadcast.cancel()
+        if self._transport:
+            self._transport.close()
 
     def stop(self):
         """Detiene el broadcaster"""
         self.running = False
+        if self.io_loop:
+            self.io_loop.call(self._close)
 
 
 # ==================== API REST (GEMELO DIGITAL) ====================
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask sobre orjson: jsonify() y request.get_json()
+    serializan en C y las respuestas se construyen directamente en bytes.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = orjson.OPT_APPEND_NEWLINE
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option),
+            mimetype=self.mimetype,
+        )
+
+
+class ValidationError(ValueError):
+    """Cuerpo JSON inválido; el mensaje es el error que se devuelve al cliente"""
+
+
+def compile_validator(*fields: tuple):
+    """
+    Construye una sola vez el validador del cuerpo JSON de un endpoint.
+    Cada campo es (nombre, conversión, comprobación, error de tipo, error de
+    rango); conversión y comprobación pueden ser None. El validador devuelve
+    la lista de valores ya convertidos o lanza ValidationError.
+    """
+    names = frozenset(field[0] for field in fields)
+
+    def validate(data) -> list:
+        if not isinstance(data, dict) or not names <= data.keys():
+            raise ValidationError("Formato inválido")
+        values = []
+        for name, convert, check, type_error, range_error in fields:
+            value = data[name]
+            # El JSON ya suele traer el tipo final (int/float): sin conversión
+            if convert is not None and type(value) is not convert:
+                try:
+                    value = convert(value)
+                except (TypeError, ValueError):
+                    raise ValidationError(type_error) from None
+            if check is not None and not check(value):
+                raise ValidationError(range_error)
+            values.append(value)
+        return values
+
+    return validate
+
+
+def _is_color(value) -> bool:
+    return isinstance(value, str) and COLOR_RE.fullmatch(value) is not None
+
+
+# Validadores de los endpoints POST (mismos mensajes de error que la API)
+DEVICE_ID_FIELD = ("id", None, lambda v: isinstance(v, str), None, "Formato inválido")
+CONTROL_VALIDATOR = compile_validator(
+    DEVICE_ID_FIELD,
+    (
+        "action",
+        lambda v: str(v).upper(),
+        lambda v: v in ("ON", "OFF"),
+        None,
+        "Acción debe ser ON u OFF",
+    ),
+)
+AUTO_OFF_VALIDATOR = compile_validator(
+    DEVICE_ID_FIELD,
+    (
+        "seconds",
+        int,
+        lambda v: 0 <= v <= MAX_AUTO_OFF,
+        "Segundos debe ser un número",
+        f"Segundos deben estar entre 0 y {MAX_AUTO_OFF}",
+    ),
+)
+BRIGHTNESS_VALIDATOR = compile_validator(
+    DEVICE_ID_FIELD,
+    (
+        "brightness",
+        int,
+        lambda v: 0 <= v <= 100,
+        "Brillo debe ser un número",
+        "Brillo debe estar entre 0 y 100",
+    ),
+)
+COLOR_VALIDATOR = compile_validator(
+    DEVICE_ID_FIELD,
+    ("color", None, _is_color, None, "Color debe estar en formato #RRGGBB"),
+)
+CURTAINS_VALIDATOR = compile_validator(
+    (
+        "position",
+        int,
+        lambda v: 0 <= v <= 100,
+        "Posición debe ser un número",
+        "Posición debe estar entre 0 y 100",
+    ),
+)
+TEMPERATURE_VALIDATOR = compile_validator(
+    (
+        "temperature",
+        float,
+        lambda v: 16 <= v <= 30,
+        "Temperatura debe ser un número",
+        "Temperatura debe estar entre 16 y 30°C",
+    ),
+)
+
+
+class NoDelayRequestHandler(WSGIRequestHandler):
+    """Handler de Werkzeug que desactiva Nagle en cada conexión aceptada"""
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+@lru_cache(maxsize=64)
+def error_body(message: str) -> bytes:
+    """Cuerpo {"success": false, "error": ...}; se serializa una vez por mensaje"""
+    return json_bytes({"success": False, "error": message}) + b"\n"
+
+
 def create_api(device_manager: DeviceManager) -> Flask:
     """
     Crea la aplicación Flask con endpoints JSON para el gemelo digital.
     Permite integración con frontends web y aplicaciones móviles.
     """
     app = Flask(__name__)
+    if ORJSON_AVAILABLE:
+        app.json = OrjsonProvider(app)
     CORS(app)  # Permitir CORS para desarrollo web
+    app.config["MAX_CONTENT_LENGTH"] = API_MAX_BODY
+
+    def error_response(message: str, status: int):
+        """Respuesta de error con el cuerpo ya serializado (ver error_body)"""
+        return app.response_class(
+            error_body(message), status=status, mimetype="application/json"
+        )
+
+    def json_body():
+        """
+        Cuerpo JSON de la petición, o None si no es JSON válido. Se parsea
+        directamente desde los bytes, sin comprobar Content-Type ni cachearlo.
+        """
+        try:
+            return json_loads(request.get_data(cache=False))
+        except ValueError:
+            return None
+
+    @app.errorhandler(413)
+    def body_too_large(error):
+        return error_response("Cuerpo demasiado grande", 413)
+
+    @app.after_request
+    def compress_json(response):
+        """Comprime con gzip (nivel 1, el más rápido) las respuestas JSON"""
+        if (
+            response.status_code != 200
+            or response.mimetype != "application/json"
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        if not request.accept_encodings["gzip"]:  # Calidad 0 si no lo acepta
+            return response
+        body = response.get_data()
+        if len(body) < API_COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(body, compresslevel=1))
+        response.headers["Content-Encoding"] = "gzip"
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # Mismo recurso con otra codificación: el ETag pasa a ser débil
+            response.set_etag(etag, weak=True)
+        return response
+
+    def invalid(error: ValidationError):
+        """Respuesta 400 para un cuerpo que no supera su validador"""
+        return error_response(str(error), 400)
 
     @app.route("/api/status", methods=["GET"])
     def get_status():
         """GET /api/status - Retorna el estado completo de la casa"""
-        devices = device_manager.get_all_devices()
-        return jsonify(
-            {
-                "success": True,
-                "timestamp": datetime.now().isoformat(),
-                "devices": devices,
-                "total": len(devices),
-            }
+        # Misma lista ya codificada que la telemetría UDP: solo se serializa
+        # de nuevo cuando cambia algún dispositivo
+        devices_json, total = device_manager.get_devices_encoded("json")
+        body = b"".join(
+            (
+                b'{"success":true,"timestamp":',
+                json_bytes(datetime.now().isoformat()),
+                b',"devices":',
+                devices_json,
+                b',"total":%d}\n' % total,
+            )
         )
+        return app.response_class(body, mimetype="application/json")
 
     @app.route("/api/device/<device_id>", methods=["GET"])
     def get_device(device_id):
         """GET /api/device/<id> - Retorna estado de un dispositivo"""
-        device = device_manager.get_device(device_id)
-        if device:
-            return jsonify({"success": True, "device": device})
-        return jsonify({"success": False, "error": "Dispositivo no encontrado"}), 404
+        device_json = device_manager.get_device_json(device_id)
+        if device_json:
+            body = b'{"success":true,"device":' + device_json + b"}\n"
+            return app.response_class(body, mimetype="application/json")
+        return error_response("Dispositivo no encontrado", 404)
 
     @app.route("/api/control", methods=["POST"])
     def control():
@@ -670,56 +1418,68 @@ def create_api(device_manager: DeviceManager) -> Flask:
         POST /api/control - Controla dispositivos
         Body JSON: {"id": "luz_salon", "action": "ON"|"OFF"}
         """
-        data = request.get_json()
-        if not data or "id" not in data or "action" not in data:
-            return jsonify({"success": False, "error": "Formato inválido"}), 400
-
-        device_id = data["id"]
-        action = data["action"].upper()
-
-        if action not in ["ON", "OFF"]:
-            return jsonify({"success": False, "error": "Acción debe ser ON u OFF"}), 400
+        try:
+            device_id, action = CONTROL_VALIDATOR(json_body())
+        except ValidationError as e:
+            return invalid(e)
 
         if device_manager.set_device_state(device_id, action):
             return jsonify(
                 {"success": True, "device_id": device_id, "new_state": action}
             )
-        return jsonify({"success": False, "error": "Dispositivo no encontrado"}), 404
+        return error_response("Dispositivo no encontrado", 404)
 
-    @app.route("/api/auto_off", methods=["POST"])
-    def auto_off():
+    @app.route("/api/control/batch", methods=["POST"])
+    def control_batch():
         """
-        POST /api/auto_off - Configura autoapagado
-        Body JSON: {"id": "luz_salon", "seconds": 10}
+        POST /api/control/batch - Varias órdenes ON/OFF en una sola petición
+        Body JSON: {"ops": [{"id": "luz_salon", "action": "ON"}, ...]}
+        Se validan todas antes de aplicar ninguna; se aplican en orden.
         """
-        data = request.get_json()
-        if not data or "id" not in data or "seconds" not in data:
-            return jsonify({"success": False, "error": "Formato inválido"}), 400
+        data = json_body()
+        ops = data.get("ops") if isinstance(data, dict) else None
+        if not isinstance(ops, list) or not ops:
+            return error_response("Formato inválido", 400)
 
-        device_id = data["id"]
         try:
-            seconds = int(data["seconds"])
-            if seconds < 0:
-                return jsonify(
-                    {"success": False, "error": "Segundos deben ser >= 0"}
-                ), 400
-
-            if device_manager.set_auto_off(device_id, seconds):
-                return jsonify(
+            parsed = [CONTROL_VALIDATOR(op) for op in ops]
+        except ValidationError as e:
+            return invalid(e)
+
+        results = []
+        for device_id, action in parsed:
+            if device_manager.set_device_state(device_id, action):
+                results.append(
+                    {"success": True, "device_id": device_id, "new_state": action}
+                )
+            else:
+                results.append(
                     {
-                        "success": True,
+                        "success": False,
                         "device_id": device_id,
-                        "auto_off_seconds": seconds,
+                        "error": "Dispositivo no encontrado",
                     }
                 )
-            return jsonify(
-                {"success": False, "error": "Dispositivo no encontrado"}
-            ), 404
+        return jsonify(
+            {"success": all(r["success"] for r in results), "results": results}
+        )
 
-        except ValueError:
+    @app.route("/api/auto_off", methods=["POST"])
+    def auto_off():
+        """
+        POST /api/auto_off - Configura autoapagado
+        Body JSON: {"id": "luz_salon", "seconds": 10}
+        """
+        try:
+            device_id, seconds = AUTO_OFF_VALIDATOR(json_body())
+        except ValidationError as e:
+            return invalid(e)
+
+        if device_manager.set_auto_off(device_id, seconds):
             return jsonify(
-                {"success": False, "error": "Segundos debe ser un número"}
-            ), 400
+                {"success": True, "device_id": device_id, "auto_off_seconds": seconds}
+            )
+        return error_response("Dispositivo no encontrado", 404)
 
     @app.route("/api/log", methods=["GET"])
     def get_log():
@@ -733,129 +1493,90 @@ def create_api(device_manager: DeviceManager) -> Flask:
         """POST /api/brightness - Ajustar brillo de luz
         Body JSON: {"id": "luz_salon", "brightness": 75}
         """
-        data = request.get_json()
-        if not data or "id" not in data or "brightness" not in data:
-            return jsonify({"success": False, "error": "Formato inválido"}), 400
-
-        device_id = data["id"]
         try:
-            brightness = int(data["brightness"])
-            if brightness < 0 or brightness > 100:
-                return jsonify(
-                    {"success": False, "error": "Brillo debe estar entre 0 y 100"}
-                ), 400
+            device_id, brightness = BRIGHTNESS_VALIDATOR(json_body())
+        except ValidationError as e:
+            return invalid(e)
 
-            if device_manager.set_brightness(device_id, brightness):
-                return jsonify(
-                    {"success": True, "device_id": device_id, "brightness": brightness}
-                )
-            return jsonify(
-                {"success": False, "error": "Dispositivo no encontrado o no es una luz"}
-            ), 404
-        except ValueError:
+        if device_manager.set_brightness(device_id, brightness):
             return jsonify(
-                {"success": False, "error": "Brillo debe ser un número"}
-            ), 400
+                {"success": True, "device_id": device_id, "brightness": brightness}
+            )
+        return error_response("Dispositivo no encontrado o no es una luz", 404)
 
     @app.route("/api/color", methods=["POST"])
     def set_color():
         """POST /api/color - Ajustar color de luz
         Body JSON: {"id": "luz_salon", "color": "#ff0000"}
         """
-        data = request.get_json()
-        if not data or "id" not in data or "color" not in data:
-            return jsonify({"success": False, "error": "Formato inválido"}), 400
-
-        device_id = data["id"]
-        color = data["color"]
-
-        if not color.startswith("#") or len(color) != 7:
-            return jsonify(
-                {"success": False, "error": "Color debe estar en formato #RRGGBB"}
-            ), 400
+        try:
+            device_id, color = COLOR_VALIDATOR(json_body())
+        except ValidationError as e:
+            return invalid(e)
 
         if device_manager.set_color(device_id, color):
             return jsonify({"success": True, "device_id": device_id, "color": color})
-        return jsonify(
-            {"success": False, "error": "Dispositivo no encontrado o no es una luz"}
-        ), 404
+        return error_response("Dispositivo no encontrado o no es una luz", 404)
 
     @app.route("/api/curtains", methods=["POST"])
     def set_curtains():
         """POST /api/curtains - Ajustar posición de cortinas
         Body JSON: {"position": 50}
         """
-        data = request.get_json()
-        if not data or "position" not in data:
-            return jsonify({"success": False, "error": "Formato inválido"}), 400
-
         try:
-            position = int(data["position"])
-            if position < 0 or position > 100:
-                return jsonify(
-                    {"success": False, "error": "Posición debe estar entre 0 y 100"}
-                ), 400
-
-            if device_manager.set_curtains(position):
-                return jsonify({"success": True, "position": position})
-            return jsonify(
-                {"success": False, "error": "No se pudo ajustar las cortinas"}
-            ), 500
-        except ValueError:
-            return jsonify(
-                {"success": False, "error": "Posición debe ser un número"}
-            ), 400
+            (position,) = CURTAINS_VALIDATOR(json_body())
+        except ValidationError as e:
+            return invalid(e)
+
+        if device_manager.set_curtains(position):
+            return jsonify({"success": True, "position": position})
+        return error_response("No se pudo ajustar las cortinas", 500)
 
     @app.route("/api/temperature", methods=["POST"])
     def set_temperature():
         """POST /api/temperature - Ajustar temperatura objetivo
         Body JSON: {"temperature": 22}
         """
-        data = request.get_json()
-        if not data or "temperature" not in data:
-            return jsonify({"success": False, "error": "Formato inválido"}), 400
-
         try:
-            temp = float(data["temperature"])
-            if temp < 16 or temp > 30:
-                return jsonify(
-                    {
-                        "success": False,
-                        "error": "Temperatura debe estar entre 16 y 30°C",
-                    }
-                ), 400
-
-            if device_manager.set_temperature(temp):
-                return jsonify({"success": True, "temperature": temp})
-            return jsonify(
-                {"success": False, "error": "No se pudo ajustar la temperatura"}
-            ), 500
-        except ValueError:
-            return jsonify(
-                {"success": False, "error": "Temperatura debe ser un número"}
-            ), 400
+            (temp,) = TEMPERATURE_VALIDATOR(json_body())
+        except ValidationError as e:
+            return invalid(e)
+
+        if device_manager.set_temperature(temp):
+            return jsonify({"success": True, "temperature": temp})
+        return error_response("No se pudo ajustar la temperatura", 500)
+
+    # Información de la API: fija, se serializa una sola vez al crear la app
+    index_info = {
+        "name": "Sistema Domótico - API REST",
+        "version": "2.0",
+        "endpoints": {
+            "GET /api/status": "Estado de todos los dispositivos",
+            "GET /api/device/<id>": "Estado de un dispositivo",
+            "POST /api/control": "Controlar dispositivo (ON/OFF)",
+            "POST /api/control/batch": "Varias órdenes ON/OFF en una petición",
+            "POST /api/auto_off": "Configurar autoapagado",
+            "POST /api/brightness": "Ajustar brillo de luz",
+            "POST /api/color": "Ajustar color de luz",
+            "POST /api/curtains": "Ajustar posición de cortinas",
+            "POST /api/temperature": "Ajustar temperatura objetivo",
+            "POST /api/chat": "Chatbot IA para controlar dispositivos",
+            "GET /api/log": "Historial de eventos",
+        },
+    }
+    index_body = json_bytes(index_info) + b"\n"
+    index_etag = hashlib.md5(index_body).hexdigest()
 
     @app.route("/", methods=["GET"])
     def index():
         """Página de información de la API"""
-        return jsonify(
-            {
-                "name": "Sistema Domótico - API REST",
-                "version": "2.0",
-                "endpoints": {
-                    "GET /api/status": "Estado de todos los dispositivos",
-                    "GET /api/device/<id>": "Estado de un dispositivo",
-                    "POST /api/control": "Controlar dispositivo (ON/OFF)",
-                    "POST /api/auto_off": "Configurar autoapagado",
-                    "POST /api/brightness": "Ajustar brillo de luz",
-                    "POST /api/color": "Ajustar color de luz",
-                    "POST /api/curtains": "Ajustar posición de cortinas",
-                    "POST /api/temperature": "Ajustar temperatura objetivo",
-                    "POST /api/chat": "Chatbot IA para controlar dispositivos",
-                    "GET /api/log": "Historial de eventos",
-                },
-            }
-        )
+        # Response nueva por petición (CORS la modifica), sobre los mismos bytes;
+        # con If-None-Match coincidente se responde 304 sin cuerpo
+        response = app.response_class(index_body, mimetype="application/json")
+        response.set_etag(index_etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = 3600
+        return response.make_conditional(request)
 
     @app.route("/api/chat", methods=["POST"])
     def chat_with_gemini():
@@ -864,27 +1585,20 @@ def create_api(device_manager: DeviceManager) -> Flask:
         Response: {"success": true, "response": "...", "actions": [...]}
         """
         if not GEMINI_AVAILABLE:
-            return jsonify(
-                {
-                    "success": False,
-                    "error": "Gemini no disponible. Instala: pip install google-generativeai",
-                }
-            ), 503
+            return error_response(
+                "Gemini no disponible. Instala: pip install google-generativeai", 503
+            )
 
         api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("API_KEY")
         if not api_key:
-            return jsonify(
-                {
-                    "success": False,
-                    "error": "API_KEY de Gemini no configurada. Establece GEMINI_API_KEY o API_KEY",
-                }
-            ), 503
+            return error_response(
+                "API_KEY de Gemini no configurada. Establece GEMINI_API_KEY o API_KEY",
+                503,
+            )
 
-        data = request.get_json()
-        if not data or "message" not in data:
-            return jsonify(
-                {"success": False, "error": "Formato inválido. Se requiere 'message'"}
-            ), 400
+        data = json_body()
+        if not isinstance(data, dict) or "message" not in data:
+            return error_response("Formato inválido. Se requiere 'message'", 400)
 
         user_message = data["message"]
 
@@ -939,8 +1653,6 @@ Si el usuario solo pregunta algo o saluda, responde normalmente sin JSON de acci
             actions_executed = []
             try:
                 # Buscar JSON en la respuesta
-                import re
-
                 json_match = re.search(
                     r'\{[^{}]*"actions"[^{}]*\[.*?\][^{}]*\}', response_text, re.DOTALL
                 )
@@ -1004,31 +1716,39 @@ class DomoticServer:
 
     def __init__(self):
         self.device_manager = DeviceManager()
+        self.io_loop = EventLoopThread()  # TCP y UDP comparten un único hilo
         self.tcp_server = TCPServer(self.device_manager, TCP_HOST, TCP_PORT)
         self.udp_broadcaster = UDPBroadcaster(
-            self.device_manager, UDP_PORT, BROADCAST_INTERVAL
+            self.device_manager, UDP_PORT, BROADCAST_INTERVAL, TELEMETRY_FORMAT
         )
         self.flask_app = create_api(self.device_manager)
+        self._stop_event = threading.Event()  # Lo activan SIGINT y SIGTERM
+        log_queue = queue.SimpleQueue()
+        console = logging.StreamHandler(sys.stdout)
+        self._log_handler = logging.handlers.QueueHandler(log_queue)
+        self._log_listener = logging.handlers.QueueListener(log_queue, console)
 
     def start(self):
         """Inicia todos los servicios del servidor"""
+        # La salida a consola de logger la hace el hilo del QueueListener
+        logger.addHandler(self._log_handler)
+        self._log_listener.start()
+
         print("=" * 60)
         print("SISTEMA DOMÓTICO - SERVIDOR CENTRAL")
         print("=" * 60)
 
+        # Bucle de eventos para TCP y UDP
+        self.io_loop.start()
+
         # Iniciar servidor TCP
-        self.tcp_server.start()
+        self.tcp_server.start(self.io_loop)
 
         # Iniciar broadcaster UDP
-        self.udp_broadcaster.start()
+        self.udp_broadcaster.start(self.io_loop)
 
         # Iniciar API REST en hilo separado
-        api_thread = threading.Thread(
-            target=lambda: self.flask_app.run(
-                host="0.0.0.0", port=API_PORT, debug=False, use_reloader=False
-            ),
-            daemon=True,
-        )
+        api_thread = threading.Thread(target=self._serve_api, daemon=True)
         api_thread.start()
         print(f"[API] Servidor REST iniciado en puerto {API_PORT}")
 
@@ -1040,18 +1760,45 @@ class DomoticServer:
         print("=" * 60)
         print("\nPresiona Ctrl+C para detener el servidor\n")
 
-        # Mantener el programa vivo
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("\n\nDeteniendo servidor...")
-            self.stop()
+        # Mantener el programa vivo: el hilo principal duerme hasta una señal
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self._stop_event.set())
+        # En Windows una espera sin timeout no se interrumpe con Ctrl+C
+        wait_timeout = 1 if os.name == "nt" else None
+        while not self._stop_event.wait(wait_timeout):
+            pass
+        print("\n\nDeteniendo servidor...")
+        self.stop()
+
+    def _serve_api(self):
+        """
+        Sirve la API REST. Con waitress: pool de hilos y keep-alive HTTP/1.1;
+        si no, el servidor de desarrollo de Werkzeug (un hilo por petición).
+        Ambos con TCP_NODELAY (waitress lo activa por defecto).
+        Siempre en este proceso: el DeviceManager vive en memoria y no puede
+        repartirse entre workers preforkeados.
+        """
+        if WAITRESS_AVAILABLE:
+            waitress_serve(
+                self.flask_app, host="0.0.0.0", port=API_PORT, threads=API_THREADS
+            )
+        else:
+            self.flask_app.run(
+                host="0.0.0.0",
+                port=API_PORT,
+                debug=False,
+                use_reloader=False,
+                threaded=True,
+                request_handler=NoDelayRequestHandler,
+            )
 
     def stop(self):
         """Detiene todos los servicios"""
         self.tcp_server.stop()
         self.udp_broadcaster.stop()
+        self.io_loop.stop()
+        self._log_listener.stop()  # Vacía los mensajes pendientes
+        logger.removeHandler(self._log_handler)
         print("Servidor detenido correctamente")
 
 
@@ -9,45 +9,186 @@ Por defecto usa el puerto 8000.
 Accesible en: http://<IP_DEL_SERVIDOR>:<PUERTO>/
 """
 
+import gzip
+import hashlib
 import http.server
-import socketserver
+import io
+import logging
+import logging.handlers
 import os
+import queue
 import sys
 import socket
+from functools import lru_cache
 
 # Configuración
 DEFAULT_PORT = 8000
 WEB_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+CACHE_MAX_AGE = 300  # Segundos que el navegador reutiliza un fichero sin preguntar
+COMPRESSIBLE_EXTENSIONS = frozenset({".html", ".js", ".css", ".json", ".svg", ".txt"})
+GZIP_LEVEL = 6  # Se comprime una vez por versión del fichero, no por petición
+
+# El hilo que atiende la petición solo encola el registro; la escritura en
+# consola la hace el QueueListener arrancado en main()
+log_queue = queue.SimpleQueue()
+logger = logging.getLogger("web")
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+logger.setLevel(logging.INFO)
+logger.propagate = False
 
 
 class DashboardHandler(http.server.SimpleHTTPRequestHandler):
     """Handler personalizado para servir el dashboard."""
 
+    # Por fichero: ruta -> (mtime_ns, tamaño, etag, cuerpo gzip o None). Se
+    # recalcula solo si el fichero cambia, así que editar el dashboard no
+    # exige reiniciar; la versión comprimida se prepara una vez, no por petición
+    _files = {}
+
     def __init__(self, *args, **kwargs):
+        self._etag = None  # ETag del fichero servido en esta respuesta
+        self._vary = False  # La respuesta depende de Accept-Encoding
         super().__init__(*args, directory=WEB_DIRECTORY, **kwargs)
 
+    @classmethod
+    def _file_info(cls, path):
+        """(etag, cuerpo gzip o None) de un fichero, o None si no se puede leer."""
+        try:
+            st = os.stat(path)
+            cached = cls._files.get(path)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                return cached[2], cached[3]
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        gz = None
+        if os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            gz = gzip.compress(data, compresslevel=GZIP_LEVEL)
+        cls._files[path] = (st.st_mtime_ns, st.st_size, etag, gz)
+        return etag, gz
+
+    def _accepts_gzip(self):
+        header = self.headers.get("Accept-Encoding", "")
+        for token in header.split(","):
+            coding, _, params = token.partition(";")
+            if coding.strip().lower() == "gzip":
+                return params.replace(" ", "") not in ("q=0", "q=0.0")
+        return False
+
+    def send_head(self):
+        """
+        Como la clase base, con ETag (304 si If-None-Match coincide) y la
+        versión gzip de los ficheros de texto si el navegador la acepta.
+        """
+        self._etag = None
+        self._vary = False
+        path = self.translate_path(self.path)
+        info = self._file_info(path) if os.path.isfile(path) else None
+        if not info:
+            return super().send_head()
+
+        etag, gz = info
+        self._vary = gz is not None
+        use_gzip = self._vary and self._accepts_gzip()
+        # Cada codificación es una representación distinta: ETag propio
+        self._etag = etag[:-1] + '-gzip"' if use_gzip else etag
+        if self._etag_matches(self.headers.get("If-None-Match")):
+            self.send_response(304)
+            self.end_headers()
+            return None
+        if not use_gzip:
+            return super().send_head()
+
+        self.send_response(200)
+        self.send_header("Content-type", self.guess_type(path))
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(gz)))
+        self.send_header("Last-Modified", self.date_time_string(os.path.getmtime(path)))
+        self.end_headers()
+        return io.BytesIO(gz)
+
+    def _etag_matches(self, header):
+        if not header:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+        return "*" in tags or self._etag in tags
+
+    def end_headers(self):
+        # Cabeceras de caché para los ficheros servidos (no para errores)
+        if self._etag:
+            self.send_header("ETag", self._etag)
+            self.send_header("Cache-Control", f"public, max-age={CACHE_MAX_AGE}")
+        if self._vary:
+            self.send_header("Vary", "Accept-Encoding")
+        super().end_headers()
+
     def do_GET(self):
         # Servir web_dashboard.html como página principal
         if self.path == "/" or self.path == "":
             self.path = "/web_dashboard.html"
         return super().do_GET()
 
+    def copyfile(self, source, outputfile):
+        """
+        Envía el fichero con os.sendfile (del fichero al socket dentro del
+        kernel); si no es posible, copia en Python como la clase base.
+        """
+        try:
+            out_fd = outputfile.fileno()
+            in_fd = source.fileno()
+            size = os.fstat(in_fd).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return super().copyfile(source, outputfile)
+
+        offset = 0
+        while offset < size:
+            try:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+            except (AttributeError, OSError):
+                if offset:
+                    raise  # Ya se envió parte: no se puede reintentar copiando
+                return super().copyfile(source, outputfile)
+            if sent == 0:
+                break
+            offset += sent
+
+    def setup(self):
+        super().setup()
+        # Respuestas pequeñas (304, ficheros cortos) sin esperar a Nagle
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
     def log_message(self, format, *args):
-        """Log personalizado con colores."""
-        print(f"[WEB] {self.address_string()} - {args[0]}")
+        """Log de cada petición, formateado solo si el nivel está activo."""
+        logger.info("%s - %s", self.address_string(), args[0])
 
 
+class DashboardServer(http.server.ThreadingHTTPServer):
+    """Un hilo por conexión: el navegador descarga HTML, JS y CSS en paralelo."""
+
+    allow_reuse_address = True  # Reinicio inmediato sin esperar TIME_WAIT
+    daemon_threads = True  # Ctrl+C no espera a las conexiones abiertas
+
+
+@lru_cache(maxsize=1)
 def get_local_ip():
-    """Obtiene la IP local de la máquina."""
+    """Obtiene la IP local de la máquina (se calcula una sola vez)."""
     try:
-        # Crear un socket y conectar a una dirección externa
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return "127.0.0.1"
+        # connect() en UDP no envía nada: solo elige la interfaz de salida
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+    except OSError:
+        pass
+    try:
+        # Sin ruta por defecto: la IP asociada al nombre de la máquina
+        ip = socket.gethostbyname(socket.gethostname())
+        if not ip.startswith("127."):
+            return ip
+    except OSError:
+        pass
+    return "127.0.0.1"
 
 
 def main():
@@ -64,8 +205,13 @@ def main():
     # Obtener IP local
     local_ip = get_local_ip()
 
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("[WEB] %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, console)
+    listener.start()
+
     # Crear servidor
-    with socketserver.TCPServer(("0.0.0.0", port), DashboardHandler) as httpd:
+    with DashboardServer(("0.0.0.0", port), DashboardHandler) as httpd:
         print("=" * 60)
         print("   🏠 SERVIDOR WEB - DASHBOARD DOMÓTICO")
         print("=" * 60)
@@ -81,6 +227,7 @@ def main():
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
+            listener.stop()  # Vacía los registros pendientes antes del aviso
             print("\n\n🛑 Servidor detenido.")
             sys.exit(0)
 